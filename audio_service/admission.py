@@ -0,0 +1,195 @@
+"""
+Controlo de admissão dos endpoints pesados (STT, TTS)
+
+Cada classe de endpoint tem um número máximo de pedidos em processamento,
+uma fila de espera limitada e um prazo máximo de espera. Em sobrecarga o
+pedido é recusado logo à entrada (antes de o upload ser lido e o áudio
+descodificado):
+- fila cheia -> 429 com Retry-After e a posição que teria na fila
+- prazo de espera excedido -> 503 com Retry-After
+
+Configuração por classe (ex. STT):
+- ADMISSION_STT_CONCURRENCY: pedidos em processamento em simultâneo
+- ADMISSION_STT_QUEUE: pedidos em espera (0 = recusa quando ocupado)
+- ADMISSION_STT_MAX_WAIT: segundos máximos na fila
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Peso da última medição na média móvel do tempo de serviço
+_EWMA_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """Pedido recusado pelo controlo de admissão"""
+
+    def __init__(self, queue: str, status_code: int, message: str, queue_position: int, retry_after: int):
+        super().__init__(message)
+        self.queue = queue
+        self.status_code = status_code
+        self.message = message
+        self.queue_position = queue_position
+        self.retry_after = retry_after
+
+    def to_dict(self) -> Dict:
+        return {
+            "detail": self.message,
+            "queue": self.queue,
+            "queue_position": self.queue_position,
+            "retry_after": self.retry_after,
+        }
+
+
+class AdmissionController:
+    """Semáforo com fila FIFO limitada e prazo de espera (um por classe de endpoint)"""
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, max_wait: float, service_seconds: float = 2.0):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+        # Métricas
+        self.admitted = 0
+        self.completed = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.queue_peak = 0
+        self.max_wait_seen = 0.0
+        self.avg_wait_seconds = 0.0
+        self.avg_service_seconds = service_seconds
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self, position: int) -> int:
+        """Estimativa (segundos) até haver vaga para quem está na posição `position`"""
+        rounds = math.ceil(position / self.concurrency)
+        return max(1, math.ceil(rounds * self.avg_service_seconds))
+
+    def _reject(self, status_code: int, message: str, position: int) -> AdmissionRejected:
+        return AdmissionRejected(self.name, status_code, message, position, self.retry_after(position))
+
+    async def acquire(self) -> float:
+        """Espera por uma vaga; devolve os segundos passados na fila"""
+        if self.in_flight < self.concurrency and not self._waiters:
+            self.in_flight += 1
+            self._record_admission(0.0)
+            return 0.0
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise self._reject(429, "Serviço sobrecarregado, tenta novamente daqui a pouco", len(self._waiters) + 1)
+
+        start = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        position = len(self._waiters)
+        self.queue_peak = max(self.queue_peak, position)
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # A vaga foi entregue no mesmo instante: passa-a ao seguinte
+                self.release()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected_timeout += 1
+            raise self._reject(503, "Tempo de espera na fila excedido", position) from None
+
+        waited = time.monotonic() - start
+        self._record_admission(waited)
+        return waited
+
+    def release(self, service_seconds: Optional[float] = None):
+        """Liberta a vaga (entregue diretamente ao primeiro da fila, se houver)"""
+        if service_seconds is not None:
+            self.completed += 1
+            self.avg_service_seconds += _EWMA_ALPHA * (service_seconds - self.avg_service_seconds)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _record_admission(self, waited: float):
+        self.admitted += 1
+        self.max_wait_seen = max(self.max_wait_seen, waited)
+        self.avg_wait_seconds += _EWMA_ALPHA * (waited - self.avg_wait_seconds)
+
+    @asynccontextmanager
+    async def slot(self):
+        waited = await self.acquire()
+        start = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self.release(time.monotonic() - start)
+
+    def stats(self) -> Dict:
+        return {
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "max_wait_seconds": self.max_wait,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "queue_peak": self.queue_peak,
+            "admitted": self.admitted,
+            "completed": self.completed,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_wait_seconds": round(self.avg_wait_seconds, 3),
+            "max_wait_seconds_seen": round(self.max_wait_seen, 3),
+            "avg_service_seconds": round(self.avg_service_seconds, 3),
+            "retry_after_estimate": self.retry_after(self.queued + 1),
+        }
+
+
+def _controller(name: str, concurrency: int, max_queue: int, max_wait: float) -> AdmissionController:
+    prefix = f"ADMISSION_{name.upper()}_"
+    return AdmissionController(
+        name,
+        concurrency=int(os.getenv(prefix + "CONCURRENCY", str(concurrency))),
+        max_queue=int(os.getenv(prefix + "QUEUE", str(max_queue))),
+        max_wait=float(os.getenv(prefix + "MAX_WAIT", str(max_wait))),
+    )
+
+
+# Um controlador por classe de endpoint (por worker)
+admission: Dict[str, AdmissionController] = {
+    # Revisões por áudio: descodificação + análise acústica + Whisper
+    "stt": _controller("stt", concurrency=2, max_queue=8, max_wait=20.0),
+    # Geração de TTS (gTTS faz um pedido HTTP por texto novo)
+    "tts": _controller("tts", concurrency=4, max_queue=16, max_wait=10.0),
+    # Sessões WebSocket de revisão em streaming (sem fila: o cliente volta ao upload)
+    "stream": _controller("stream", concurrency=8, max_queue=0, max_wait=0.0),
+}
+
+# Caminho -> classe de admissão
+ADMISSION_ROUTES: Dict[str, str] = {
+    "/audio-flashcards/review/fonema": "stt",
+    "/audio-flashcards/review/spelling": "stt",
+    "/audio-flashcards/review/audio": "stt",
+    "/tts/generate": "tts",
+}
+
+
+def report() -> Dict:
+    return {name: controller.stats() for name, controller in admission.items()}
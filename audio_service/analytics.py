@@ -0,0 +1,374 @@
+"""
+Consultas analíticas sobre `avaliacoes_alunos` (Qualidade)
+Projeção de colunas, paginação por keyset e streaming a partir de um
+cursor do lado do servidor
+"""
+import csv
+import importlib.util
+import io
+import json
+import logging
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError, SQLAlchemyError
+
+from components import ComponentUnavailable
+from database import AvaliacaoAluno, aggregate_sql, async_engine, rollup_for
+
+logger = logging.getLogger(__name__)
+
+# Exportação colunar (Arrow IPC / Parquet) - opcional, importado só ao exportar
+ARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+# Linhas pedidas ao Postgres de cada vez nas respostas em streaming
+STREAM_BATCH_SIZE = 1000
+
+AVALIACOES_TABLE = AvaliacaoAluno.__table__
+
+# Campos devolvidos por omissão (resposta original de /api/avaliacoes)
+DEFAULT_FIELDS = (
+    "id", "ano_letivo", "periodo", "ano", "turma", "disciplina",
+    "total_alunos", "total_positivos", "percent_positivos",
+    "total_negativos", "percent_negativos", "ciclo",
+    "classificacoes", "sheet_name", "created_at",
+)
+AVAILABLE_FIELDS = tuple(column.name for column in AVALIACOES_TABLE.columns)
+
+FILTER_FIELDS = ("ano_letivo", "periodo", "ciclo", "ano")
+
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """Converte `fields=a,b,c` na lista de colunas a selecionar"""
+    if not fields:
+        return DEFAULT_FIELDS
+    requested = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    invalid = [f for f in requested if f not in AVAILABLE_FIELDS]
+    if invalid:
+        raise ValueError(f"Campos inválidos: {invalid}. Disponíveis: {list(AVAILABLE_FIELDS)}")
+    return requested
+
+
+def apply_filters(stmt, filters: Dict[str, Optional[str]]):
+    for name in FILTER_FIELDS:
+        value = filters.get(name)
+        if value:
+            stmt = stmt.where(AVALIACOES_TABLE.c[name] == value)
+    return stmt
+
+
+def build_avaliacoes_query(
+    filters: Dict[str, Optional[str]],
+    fields: Tuple[str, ...],
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+):
+    """SELECT apenas das colunas pedidas, ordenado por id (o cursor do keyset)"""
+    columns = [AVALIACOES_TABLE.c[f] for f in fields]
+    if "id" not in fields:
+        columns.append(AVALIACOES_TABLE.c.id)
+    stmt = apply_filters(select(*columns), filters).order_by(AVALIACOES_TABLE.c.id)
+    if after_id is not None:
+        stmt = stmt.where(AVALIACOES_TABLE.c.id > after_id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def _connection_lost(error: Exception) -> bool:
+    """Erro de ligação (Postgres em baixo, ligação perdida) e não da consulta"""
+    if isinstance(error, (OperationalError, InterfaceError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+@asynccontextmanager
+async def _connect():
+    """
+    Ligação do pool; falhas de ligação ao Postgres chegam ao handler como 503.
+    Erros da consulta (SQL ou parâmetros inválidos) seguem como erros normais (500)
+    """
+    connected = False
+    try:
+        async with async_engine.connect() as conn:
+            connected = True
+            yield conn
+    except (SQLAlchemyError, OSError) as e:
+        if connected and not _connection_lost(e):
+            raise
+        raise ComponentUnavailable("db", str(e)) from e
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def row_to_dict(row, fields: Tuple[str, ...]) -> Dict:
+    mapping = row._mapping
+    return {f: _json_value(mapping[f]) for f in fields}
+
+
+async def fetch_avaliacoes(
+    filters: Dict[str, Optional[str]],
+    fields: Tuple[str, ...],
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> Tuple[List[Dict], Optional[int]]:
+    """Uma página de resultados e o `after_id` da página seguinte (None no fim)"""
+    stmt = build_avaliacoes_query(filters, fields, after_id, limit)
+    async with _connect() as conn:
+        rows = (await conn.execute(stmt)).fetchall()
+    next_after_id = rows[-1]._mapping["id"] if limit is not None and len(rows) == limit else None
+    return [row_to_dict(row, fields) for row in rows], next_after_id
+
+
+async def _iter_partitions(stmt) -> AsyncIterator[list]:
+    """Linhas lidas em lotes de um cursor do lado do servidor"""
+    async with _connect() as conn:
+        result = await conn.stream(stmt)
+        async for partition in result.partitions(STREAM_BATCH_SIZE):
+            yield partition
+
+
+async def _iter_batches(
+    filters: Dict[str, Optional[str]],
+    fields: Tuple[str, ...],
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> AsyncIterator[List[Dict]]:
+    """Lotes de registos (dicts) lidos de um cursor do lado do servidor"""
+    stmt = build_avaliacoes_query(filters, fields, after_id, limit)
+    async for partition in _iter_partitions(stmt):
+        yield [row_to_dict(row, fields) for row in partition]
+
+
+async def stream_ndjson(filters, fields, after_id=None, limit=None) -> AsyncIterator[str]:
+    """Uma linha JSON por registo (application/x-ndjson)"""
+    async for batch in _iter_batches(filters, fields, after_id, limit):
+        yield "".join(json.dumps(data, ensure_ascii=False) + "\n" for data in batch)
+
+
+async def stream_json_array(filters, fields, after_id=None, limit=None) -> AsyncIterator[str]:
+    """Array JSON emitido incrementalmente, compatível com a resposta original"""
+    yield "["
+    first = True
+    async for batch in _iter_batches(filters, fields, after_id, limit):
+        chunk = ",".join(json.dumps(data, ensure_ascii=False) for data in batch)
+        yield ("" if first else ",") + chunk
+        first = False
+    yield "]"
+
+
+# ============================================
+# AGREGAÇÕES
+# ============================================
+GROUP_FIELDS = ("ciclo", "ano", "turma", "disciplina", "periodo", "ano_letivo")
+
+
+def parse_group_by(group_by: Optional[str]) -> Tuple[str, ...]:
+    """Converte `group_by=a,b` nas colunas de agrupamento"""
+    if not group_by:
+        return ("ciclo",)
+    requested = tuple(dict.fromkeys(g.strip() for g in group_by.split(",") if g.strip()))
+    invalid = [g for g in requested if g not in GROUP_FIELDS]
+    if invalid:
+        raise ValueError(f"Agrupamento inválido: {invalid}. Disponíveis: {list(GROUP_FIELDS)}")
+    return requested
+
+
+def _where_clause(filters: Dict[str, Optional[str]]) -> Tuple[str, Dict]:
+    conditions, params = [], {}
+    for name in FILTER_FIELDS:
+        value = filters.get(name)
+        if value:
+            conditions.append(f"{name} = :{name}")
+            params[name] = value
+    return ("WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+
+async def aggregate_avaliacoes(filters: Dict[str, Optional[str]], group_by: Tuple[str, ...]) -> List[Dict]:
+    """
+    Agregados por grupo calculados no Postgres:
+    - media ponderada pelo total de alunos
+    - soma de total_alunos / total_positivos / total_negativos
+    - histograma `classificacoes` somado chave a chave
+    Lê dos rollups pré-calculados sempre que cobrem o agrupamento pedido
+    """
+    where, params = _where_clause(filters)
+    rollup = rollup_for(group_by)
+    source = rollup or AVALIACOES_TABLE.name
+    sql = (
+        aggregate_sql(source, group_by, where, from_rollup=rollup is not None)
+        + " ORDER BY " + ", ".join(f"t.{g}" for g in group_by)
+    )
+
+    async with _connect() as conn:
+        rows = (await conn.execute(text(sql), params)).fetchall()
+
+    resultado = []
+    for row in rows:
+        m = row._mapping
+        total = m["total_alunos"] or 0
+        data = {g: m[g] for g in group_by}
+        data.update({
+            "registos": m["registos"],
+            "total_alunos": total,
+            "total_positivos": m["total_positivos"],
+            "total_negativos": m["total_negativos"],
+            "percent_positivos": round(100.0 * m["total_positivos"] / total, 2) if total else None,
+            "percent_negativos": round(100.0 * m["total_negativos"] / total, 2) if total else None,
+            "media_percent_positivos": (
+                round(float(m["soma_percent_positivos"]) / m["registos_com_percent"], 2)
+                if m["registos_com_percent"] else None
+            ),
+            "media": (
+                round(float(m["soma_media_ponderada"]) / m["alunos_com_media"], 2)
+                if m["alunos_com_media"] and m["soma_media_ponderada"] is not None else None
+            ),
+            "classificacoes": {k: _json_value(v) for k, v in m["classificacoes"].items()},
+        })
+        resultado.append(data)
+    return resultado
+
+
+# ============================================
+# EXPORTAÇÃO (CSV / Arrow IPC / Parquet)
+# ============================================
+EXPORT_FIELDS = (
+    "id", "ano_letivo", "periodo", "ciclo", "ano", "turma", "disciplina",
+    "total_alunos", "total_positivos", "percent_positivos",
+    "total_negativos", "percent_negativos", "media", "sheet_name", "created_at",
+)
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def classificacoes_columns(ciclo: Optional[str]) -> List[Tuple[str, str]]:
+    """
+    Colunas `classif_<nível>` para o ciclo pedido (ou todos os ciclos)
+    Devolve pares (chave em classificacoes, nome da coluna)
+    """
+    from excel_import import CICLO_ESCALAS
+
+    escalas = [CICLO_ESCALAS[ciclo]] if ciclo in CICLO_ESCALAS else CICLO_ESCALAS.values()
+    keys = dict.fromkeys(key for escala in escalas for key, _, _ in escala)
+    return [(key, f"classif_{key}") for key in keys]
+
+
+async def _export_batches(
+    filters: Dict[str, Optional[str]], classif: List[Tuple[str, str]]
+) -> AsyncIterator[Dict[str, list]]:
+    """Lotes em formato colunar (dict coluna -> lista) lidos de um cursor do servidor"""
+    stmt = build_avaliacoes_query(filters, EXPORT_FIELDS + ("classificacoes",))
+    async for partition in _iter_partitions(stmt):
+        columns = {f: [row._mapping[f] for row in partition] for f in EXPORT_FIELDS}
+        # numeric no Postgres (Decimal) -> float64 no schema Arrow
+        for name in ("media", "percent_positivos", "percent_negativos"):
+            columns[name] = [float(v) if v is not None else None for v in columns[name]]
+        valores = [row._mapping["classificacoes"] or {} for row in partition]
+        for key, name in classif:
+            columns[name] = [v.get(key) for v in valores]
+        yield columns
+
+
+class _ChunkSink(io.RawIOBase):
+    """Ficheiro só de escrita cujos bytes são recolhidos após cada lote"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _arrow_schema(classif: List[Tuple[str, str]]):
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("ano_letivo", pa.string()),
+            ("periodo", pa.string()),
+            ("ciclo", pa.string()),
+            ("ano", pa.string()),
+            ("turma", pa.string()),
+            ("disciplina", pa.string()),
+            ("total_alunos", pa.int32()),
+            ("total_positivos", pa.int32()),
+            ("percent_positivos", pa.float64()),
+            ("total_negativos", pa.int32()),
+            ("percent_negativos", pa.float64()),
+            ("media", pa.float64()),
+            ("sheet_name", pa.string()),
+            ("created_at", pa.timestamp("us")),
+        ]
+        + [(name, pa.int32()) for _, name in classif]
+    )
+
+
+async def stream_export(filters: Dict[str, Optional[str]], formato: str) -> AsyncIterator[bytes]:
+    """
+    Exporta o conjunto filtrado com `classificacoes` achatado em colunas
+    tipadas, escrevendo um lote (row group / record batch) de cada vez
+    """
+    classif = classificacoes_columns(filters.get("ciclo"))
+    columns = list(EXPORT_FIELDS) + [name for _, name in classif]
+
+    if formato == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(columns)
+        async for batch in _export_batches(filters, classif):
+            writer.writerows(zip(*(batch[c] for c in columns)))
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(classif)
+    sink = _ChunkSink()
+    if formato == "arrow":
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+    else:
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        write = writer.write_batch
+
+    rows = 0
+    async for batch in _export_batches(filters, classif):
+        write(pa.RecordBatch.from_pydict(batch, schema=schema))
+        rows += len(batch["id"])
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+    logger.info(f"[EXPORT] {rows} linhas exportadas em {formato}")
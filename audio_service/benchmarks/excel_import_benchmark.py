@@ -0,0 +1,216 @@
+"""
+Benchmark da importação Excel: pipeline vetorial vs. ciclo df.iterrows()
+
+Uso:
+    python benchmarks/excel_import_benchmark.py --turmas 400 --disciplinas 14
+    python benchmarks/excel_import_benchmark.py --xlsx   # inclui leitura openpyxl
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from excel_import import (  # noqa: E402
+    DISCIPLINAS_IGNORADAS,
+    detect_ciclo,
+    read_workbook,
+    transform_workbook,
+)
+
+DISCIPLINAS = [
+    "Português", "Matemática", "Inglês", "História", "Geografia", "Ciências Naturais",
+    "Físico-Química", "Educação Física", "Educação Visual", "TIC", "Francês",
+    "Cidadania e Desenvolvimento", "Apoio ao Estudo", "Educação Moral e Religiosa",
+]
+
+
+def build_workbook(turmas: int, disciplinas: int, seed: int = 42) -> dict:
+    """Gera um workbook sintético com as quatro sheets de ciclo"""
+    rng = np.random.default_rng(seed)
+    nomes = (DISCIPLINAS * (disciplinas // len(DISCIPLINAS) + 1))[:disciplinas]
+    n = turmas * disciplinas
+    base = {
+        "Ano": np.repeat(rng.integers(1, 13, turmas), disciplinas),
+        "Turma": np.repeat([f"T{i:04d}" for i in range(turmas)], disciplinas),
+        "Disciplina": np.tile(nomes, turmas),
+    }
+
+    def totais(escalas):
+        total = escalas.sum(axis=1)
+        positivos = escalas[:, -3:].sum(axis=1)
+        return total, positivos, np.round(positivos / np.maximum(total, 1) * 100, 1)
+
+    sheets = {}
+    niveis = rng.integers(0, 8, size=(n, 4))
+    total, positivos, percent = totais(niveis)
+    sheets["Basico 1"] = pd.DataFrame({
+        **base, "I": niveis[:, 0], "S": niveis[:, 1], "B": niveis[:, 2], "MB": niveis[:, 3],
+        "T. Alunos": total, "T. Posit.": positivos, "% Posit.": percent,
+    })
+
+    for nome in ("Basico 2", "Basico 3"):
+        niveis = rng.integers(0, 8, size=(n, 5))
+        total, positivos, percent = totais(niveis)
+        sheets[nome] = pd.DataFrame({
+            **base, **{i: niveis[:, i - 1] for i in range(1, 6)},
+            "T. Alunos": total, "T. Posit.": positivos, "% Posit.": percent,
+        })
+
+    niveis = rng.integers(0, 8, size=(n, 5))
+    total, positivos, percent = totais(niveis)
+    media = np.where(rng.random(n) < 0.5, np.round(rng.uniform(8, 18, n), 2), np.nan)
+    sheets["Secundario"] = pd.DataFrame({
+        **base, "1 - 7": niveis[:, 0], "8 - 9": niveis[:, 1], "10 - 13": niveis[:, 2],
+        "14 - 17": niveis[:, 3], "18 - 20": niveis[:, 4],
+        "Nº Alunos": total, "T. Positivas": positivos, "% Positivas": percent, "Média": media,
+    })
+    return sheets
+
+
+def legacy_transform(excel_data: dict, ano_letivo: str, periodo: str) -> list:
+    """Implementação anterior (linha a linha) usada como referência"""
+    def calculate_media(ciclo, classificacoes, total_alunos, row_dict=None):
+        if ciclo == 'secundario':
+            media_excel = row_dict.get('Média') if row_dict else None
+            if pd.notna(media_excel):
+                return float(media_excel)
+            sum_val = (4 * classificacoes.get('1_7', 0) + 8.5 * classificacoes.get('8_9', 0) +
+                       11.5 * classificacoes.get('10_13', 0) + 15.5 * classificacoes.get('14_17', 0) +
+                       19 * classificacoes.get('18_20', 0))
+            total = total_alunos or 1
+            return sum_val / total if total > 0 else 0
+        if ciclo == '1_ciclo':
+            sum_val = (1 * classificacoes.get('I', 0) + 2 * classificacoes.get('S', 0) +
+                       3 * classificacoes.get('B', 0) + 4 * classificacoes.get('MB', 0))
+            total = total_alunos or 1
+            return sum_val / total if total > 0 else 0
+        elif ciclo in ['2_ciclo', '3_ciclo']:
+            sum_val = sum(i * classificacoes.get(str(i), 0) for i in range(1, 6))
+            total = total_alunos or 1
+            return sum_val / total if total > 0 else 0
+        return 0
+
+    registos = []
+    for sheet_name, df in excel_data.items():
+        df = df.dropna(how='all').reset_index(drop=True)
+        if df.empty:
+            continue
+        ciclo = detect_ciclo(sheet_name)
+        for _, row in df.iterrows():
+            row_dict = row.to_dict()
+            disciplina_raw = row_dict.get('Disciplina', '')
+            if pd.isna(disciplina_raw):
+                continue
+            disciplina_lower = str(disciplina_raw).strip().lower()
+            if disciplina_lower in DISCIPLINAS_IGNORADAS:
+                continue
+            if disciplina_lower == '' or str(row_dict.get('Turma', '')).strip() == '':
+                continue
+            classificacoes = {}
+            if ciclo == "1_ciclo":
+                for key in ("I", "S", "B", "MB"):
+                    if pd.notna(row_dict.get(key)):
+                        classificacoes[key] = int(row_dict.get(key) or 0)
+            elif ciclo in ["2_ciclo", "3_ciclo"]:
+                for i in range(1, 6):
+                    val = None
+                    if str(i) in row_dict:
+                        val = row_dict.get(str(i))
+                    elif i in row_dict:
+                        val = row_dict.get(i)
+                    elif f" {i}" in row_dict:
+                        val = row_dict.get(f" {i}")
+                    elif f"{i} " in row_dict:
+                        val = row_dict.get(f"{i} ")
+                    if val is not None and pd.notna(val):
+                        classificacoes[str(i)] = int(val)
+            elif ciclo == "secundario":
+                for col, key in [('1 - 7', '1_7'), ('8 - 9', '8_9'), ('10 - 13', '10_13'),
+                                 ('14 - 17', '14_17'), ('18 - 20', '18_20')]:
+                    val = row_dict.get(col)
+                    if pd.notna(val):
+                        classificacoes[key] = int(val)
+            total_alunos = int(row_dict.get('T. Alunos') or row_dict.get('Nº Alunos') or 0)
+            total_positivos = int(row_dict.get('T. Posit.') or row_dict.get('T. Positivas') or 0)
+            percent_positivos = float(row_dict.get('% Posit.') or row_dict.get('% Positivas') or 0.0)
+            if percent_positivos == 0:
+                continue
+            registos.append({
+                "ano_letivo": ano_letivo,
+                "periodo": periodo,
+                "ano": str(row_dict.get('Ano', '')),
+                "turma": str(row_dict.get('Turma', '')),
+                "disciplina": str(disciplina_raw).strip(),
+                "total_alunos": total_alunos,
+                "total_positivos": total_positivos,
+                "percent_positivos": percent_positivos,
+                "total_negativos": total_alunos - total_positivos if total_alunos > 0 else 0,
+                "percent_negativos": 100 - percent_positivos if percent_positivos > 0 else 0,
+                "ciclo": ciclo,
+                "classificacoes": classificacoes,
+                "sheet_name": sheet_name,
+                "media": calculate_media(ciclo, classificacoes, total_alunos, row_dict),
+            })
+    return registos
+
+
+def _timed(fn, *args, repeat: int = 3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _assert_equivalent(novos: list, antigos: list):
+    assert len(novos) == len(antigos), f"{len(novos)} != {len(antigos)} registos"
+    for novo, antigo in zip(novos, antigos):
+        for key, value in antigo.items():
+            if isinstance(value, float):
+                assert abs(novo[key] - value) < 1e-9, (key, novo[key], value)
+            else:
+                assert novo[key] == value, (key, novo[key], value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turmas", type=int, default=400)
+    parser.add_argument("--disciplinas", type=int, default=14)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--xlsx", action="store_true", help="Escrever e reler o workbook via openpyxl")
+    args = parser.parse_args()
+
+    excel_data = build_workbook(args.turmas, args.disciplinas)
+
+    if args.xlsx:
+        buffer = io.BytesIO()
+        with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+            for sheet_name, df in excel_data.items():
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
+        buffer.seek(0)
+        start = time.perf_counter()
+        excel_data = read_workbook(buffer)
+        print(f"Leitura openpyxl:       {time.perf_counter() - start:8.3f}s")
+
+    linhas = sum(len(df) for df in excel_data.values())
+    t_legacy, antigos = _timed(legacy_transform, excel_data, "2024/2025", "1", repeat=args.repeat)
+    t_vector, novos = _timed(transform_workbook, excel_data, "2024/2025", "1", repeat=args.repeat)
+    _assert_equivalent(novos, antigos)
+
+    print(f"Linhas no workbook:     {linhas}")
+    print(f"Registos gerados:       {len(novos)}")
+    print(f"iterrows (anterior):    {t_legacy:8.3f}s")
+    print(f"vetorial (atual):       {t_vector:8.3f}s")
+    print(f"Speedup:                {t_legacy / t_vector:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark A/B de motores STT: latência e acerto sobre as mesmas gravações
+
+Para cada motor corre o pipeline de revisão (sem efeitos secundários) em
+todos os clips de um manifest (mesmo formato da avaliação em lote) e mede
+a latência da transcrição (p50/p95), os clips dados como corretos e a
+semelhança média com o texto esperado. Sem --manifest usa o sinal
+sintético do warm-up; com --motores fake corre sem descarregar nenhum
+modelo (CI).
+
+Uso:
+    python benchmarks/stt_backends_benchmark.py --motores fake
+    python benchmarks/stt_backends_benchmark.py --manifest gravacoes/ --motores whisper:tiny,whisper:small,vosk
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cpu_config  # noqa: E402
+
+cpu_config.configure_thread_pools()
+
+import speech_analysis  # noqa: E402
+import stt_backends  # noqa: E402
+from evaluation_jobs import CARD_TYPES, read_manifest  # noqa: E402
+from review_pipeline import CARD_TYPE_CONFIGS, CORE_STAGES, ReviewContext, ReviewPipeline  # noqa: E402
+from stt_threads_benchmark import synthetic_wav  # noqa: E402
+
+
+def clips_sinteticos(card_type: str, repeticoes: int, pasta: str) -> list:
+    audio = os.path.join(pasta, "sintetico.wav")
+    synthetic_wav(audio, seconds=1.5)
+    return [
+        {
+            "file": "sintetico.wav",
+            "path": audio,
+            "card_type": card_type,
+            "expected_text": "ba",
+            "threshold": CARD_TYPE_CONFIGS[card_type].default_threshold,
+            "language": "pt",
+        }
+        for _ in range(repeticoes)
+    ]
+
+
+def medir(spec: str, clips: list, pipeline: ReviewPipeline) -> dict:
+    start = time.perf_counter()
+    backend = stt_backends.get(spec)
+    carga = time.perf_counter() - start
+
+    latencias, corretos, semelhancas = [], 0, []
+    for clip in clips:
+        ctx = ReviewContext(
+            config=CARD_TYPE_CONFIGS[clip["card_type"]],
+            expected_text=clip["expected_text"],
+            threshold=clip["threshold"],
+            language=clip["language"],
+            source_path=clip["path"],
+            stt=backend,
+            tag="BENCH",
+        )
+        try:
+            pipeline.run_sync(ctx)
+        finally:
+            ctx.cleanup()
+        if "transcribe" in ctx.timings:
+            latencias.append(ctx.timings["transcribe"] / 1000)
+        corretos += int(bool(ctx.is_correct))
+        semelhancas.append(ctx.analysis["content_similarity"] if ctx.analysis else 0.0)
+
+    latencias.sort()
+    return {
+        "motor": backend.name,
+        "carga_s": carga,
+        "p50": statistics.median(latencias) if latencias else 0.0,
+        "p95": latencias[min(len(latencias) - 1, int(0.95 * len(latencias)))] if latencias else 0.0,
+        "corretos": corretos / len(clips),
+        "semelhanca": statistics.mean(semelhancas),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--manifest", help="Pasta com manifest.csv e os clips (por omissão, sinal sintético)")
+    parser.add_argument("--motores", default="fake", help="Lista de motores, ex. whisper:tiny,whisper:small,vosk,fake")
+    parser.add_argument("--tipo", default="fonema", choices=CARD_TYPES, help="card_type por omissão dos clips")
+    parser.add_argument("--repeticoes", type=int, default=8, help="Repetições do clip sintético")
+    args = parser.parse_args()
+
+    try:
+        speech_analysis.load_g2p()
+    except Exception as e:
+        print(f"G2P indisponível ({e}): comparação só com Jellyfish")
+
+    with tempfile.TemporaryDirectory() as pasta:
+        if args.manifest:
+            clips = read_manifest(Path(args.manifest), args.tipo, None, "pt")
+        else:
+            clips = clips_sinteticos(args.tipo, args.repeticoes, pasta)
+
+        pipeline = ReviewPipeline(CORE_STAGES)
+        print(f"Clips: {len(clips)} | motores: {args.motores}")
+        print(f"{'motor':>16} {'carga (s)':>9} {'p50 (s)':>9} {'p95 (s)':>9} {'corretos':>9} {'semelhança':>10}")
+        for spec in args.motores.split(","):
+            try:
+                r = medir(spec.strip(), clips, pipeline)
+            except Exception as e:
+                print(f"{spec.strip():>16} indisponível: {e}")
+                continue
+            print(
+                f"{r['motor']:>16} {r['carga_s']:>9.2f} {r['p50']:>9.3f} {r['p95']:>9.3f} "
+                f"{r['corretos']:>9.0%} {r['semelhanca']:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
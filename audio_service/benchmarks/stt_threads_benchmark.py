@@ -0,0 +1,129 @@
+"""
+Benchmark de threads do Whisper (CTranslate2): num_workers x cpu_threads
+
+Para cada configuração carrega o modelo, transcreve o clip com
+`num_workers` pedidos em simultâneo e mede débito (clips/s) e latência
+(p50/p95). No fim indica a configuração recomendada: o maior débito com
+p95 até --p95-tolerancia vezes o melhor p95 medido.
+
+Uso:
+    python benchmarks/stt_threads_benchmark.py
+    python benchmarks/stt_threads_benchmark.py --audio clip.wav --pedidos 24
+    python benchmarks/stt_threads_benchmark.py --workers 1,2,4,8 --threads 1,2,4
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cpu_config  # noqa: E402
+
+cpu_config.configure_thread_pools()
+
+import numpy as np  # noqa: E402
+
+from model_server import create_whisper_model  # noqa: E402
+
+
+def synthetic_wav(path: str, seconds: float = 3.0, sample_rate: int = 16000):
+    """Sinal vozeado sintético (mesmo princípio do warm-up do serviço)"""
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    voiced = sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 12))
+    signal = voiced * 0.5 * (1 - np.cos(2 * np.pi * 3 * t))
+    signal += 0.02 * np.random.default_rng(0).standard_normal(t.size)
+    pcm = (signal / np.max(np.abs(signal)) * 0.5 * 32767).astype(np.int16)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+
+
+def configuracoes(cpus: int):
+    """Por omissão: workers em potências de 2 e threads que ocupam os cores"""
+    workers = [w for w in (1, 2, 4, 8, 16) if w <= cpus]
+    for w in workers:
+        threads = sorted({max(1, cpus // w), max(1, cpus // (2 * w))})
+        for t in threads:
+            yield w, t
+
+
+def medir(audio: str, num_workers: int, cpu_threads: int, pedidos: int) -> dict:
+    model = create_whisper_model(cpu_threads=cpu_threads, num_workers=num_workers)
+
+    def transcrever(_):
+        start = time.perf_counter()
+        segments, _info = model.transcribe(audio, language="pt", beam_size=5, best_of=5, temperature=0.0)
+        "".join(segment.text for segment in segments)
+        return time.perf_counter() - start
+
+    transcrever(None)  # warm-up
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        latencias = sorted(pool.map(transcrever, range(pedidos)))
+    total = time.perf_counter() - start
+
+    return {
+        "num_workers": num_workers,
+        "cpu_threads": cpu_threads,
+        "clips_s": pedidos / total,
+        "p50": statistics.median(latencias),
+        "p95": latencias[min(len(latencias) - 1, int(0.95 * len(latencias)))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--audio", help="Clip WAV (por omissão, sinal sintético de 3s)")
+    parser.add_argument("--pedidos", type=int, default=16, help="Transcrições por configuração")
+    parser.add_argument("--workers", help="Lista de num_workers, ex. 1,2,4")
+    parser.add_argument("--threads", help="Lista de cpu_threads, ex. 1,2,4")
+    parser.add_argument("--p95-tolerancia", type=float, default=1.5)
+    args = parser.parse_args()
+
+    cpus = cpu_config.available_cpus()
+    if args.workers or args.threads:
+        workers = [int(w) for w in (args.workers or "1").split(",")]
+        threads = [int(t) for t in (args.threads or str(cpus)).split(",")]
+        configs = [(w, t) for w in workers for t in threads]
+    else:
+        configs = list(configuracoes(cpus))
+
+    audio = args.audio
+    if not audio:
+        audio = tempfile.mktemp(suffix=".wav")
+        synthetic_wav(audio)
+
+    print(f"Cores disponíveis: {cpus} | pedidos por configuração: {args.pedidos}")
+    print(f"{'num_workers':>11} {'cpu_threads':>11} {'clips/s':>9} {'p50 (s)':>9} {'p95 (s)':>9}")
+    resultados = []
+    try:
+        for num_workers, cpu_threads in configs:
+            r = medir(audio, num_workers, cpu_threads, args.pedidos)
+            resultados.append(r)
+            print(f"{r['num_workers']:>11} {r['cpu_threads']:>11} {r['clips_s']:>9.2f} {r['p50']:>9.2f} {r['p95']:>9.2f}")
+    finally:
+        if not args.audio and os.path.exists(audio):
+            os.unlink(audio)
+
+    melhor_p95 = min(r["p95"] for r in resultados)
+    aceitaveis = [r for r in resultados if r["p95"] <= args.p95_tolerancia * melhor_p95]
+    escolha = max(aceitaveis, key=lambda r: r["clips_s"])
+    print()
+    print(f"Maior débito:  {max(resultados, key=lambda r: r['clips_s'])}")
+    print(f"Menor p95:     {min(resultados, key=lambda r: r['p95'])}")
+    print(
+        f"Recomendado:   WHISPER_NUM_WORKERS={escolha['num_workers']} "
+        f"WHISPER_CPU_THREADS={escolha['cpu_threads']} "
+        f"({escolha['clips_s']:.2f} clips/s, p95 {escolha['p95']:.2f}s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
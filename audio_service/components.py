@@ -0,0 +1,140 @@
+"""
+Arranque faseado do serviço de áudio
+O servidor HTTP aceita ligações de imediato; os componentes pesados
+(Whisper, G2P, base de dados, TTS) são carregados em background e o
+estado de cada um é exposto em /health/ready
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+DISABLED = "disabled"
+
+# Componentes necessários para a instância receber tráfego (/health/ready)
+READINESS_COMPONENTS = tuple(
+    c.strip() for c in os.getenv("READINESS_COMPONENTS", "whisper,tts,warmup").split(",") if c.strip()
+)
+# Intervalo entre tentativas de ligação à base de dados no arranque
+DB_RETRY_INTERVAL = float(os.getenv("DB_RETRY_INTERVAL", "5"))
+# Intervalo entre tentativas de carregar o STT (ex. falha transitória a descarregar o modelo)
+STT_RETRY_INTERVAL = float(os.getenv("STT_RETRY_INTERVAL", "30"))
+# Componentes cuja falha não bloqueia a readiness (o erro fica no relatório):
+# sem warm-up os pedidos são servidos na mesma, só o primeiro é mais lento
+NON_BLOCKING_FAILURES = ("warmup",)
+
+
+class ComponentUnavailable(ConnectionError):
+    """Um componente deixou de responder (ex.: ligação ao Postgres perdida)"""
+
+    def __init__(self, name: str, message: str):
+        super().__init__(f"{name}: {message}")
+        self.name = name
+
+
+class ComponentState:
+    def __init__(self, name: str):
+        self.name = name
+        self.status = PENDING
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.ready_at: Optional[float] = None
+        self.seconds: Optional[float] = None
+        # Informação devolvida pelo loader (ex.: tempos do warm-up)
+        self.details: Optional[Dict] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "status": self.status,
+            "error": self.error,
+            "attempts": self.attempts,
+            "load_seconds": self.seconds,
+            "ready_at": self.ready_at,
+            "details": self.details,
+        }
+
+
+class ComponentRegistry:
+    """Estado de carregamento de cada componente"""
+
+    def __init__(
+        self,
+        names: Tuple[str, ...],
+        required: Tuple[str, ...] = READINESS_COMPONENTS,
+        non_blocking: Tuple[str, ...] = NON_BLOCKING_FAILURES,
+    ):
+        self.started_at = time.time()
+        self.required = tuple(name for name in required if name in names)
+        self.non_blocking = tuple(non_blocking)
+        self._states: Dict[str, ComponentState] = {name: ComponentState(name) for name in names}
+
+    def get(self, name: str) -> ComponentState:
+        return self._states[name]
+
+    def is_ready(self, name: str) -> bool:
+        return self._states[name].status == READY
+
+    def disable(self, name: str, reason: str):
+        """Componente não configurado nesta instância (ex.: réplica só de STT)"""
+        state = self._states[name]
+        state.status = DISABLED
+        state.error = reason
+        logger.info(f"[STARTUP] {name} desativado: {reason}")
+
+    def ready(self) -> bool:
+        """
+        Componentes desativados por configuração não bloqueiam a readiness,
+        nem os de NON_BLOCKING_FAILURES que falharam
+        """
+        return all(
+            self._states[name].status in (READY, DISABLED)
+            or (name in self.non_blocking and self._states[name].status == FAILED)
+            for name in self.required
+        )
+
+    async def load(self, name: str, loader: Callable[[], Optional[Dict]], retry_interval: Optional[float] = None) -> bool:
+        """
+        Executa `loader` numa thread (não bloqueia o event loop)
+        Com `retry_interval` volta a tentar até o componente ficar pronto
+        """
+        state = self._states[name]
+        while True:
+            state.status = LOADING
+            state.attempts += 1
+            start = time.perf_counter()
+            try:
+                details = await asyncio.to_thread(loader)
+            except Exception as e:
+                state.status = FAILED
+                state.error = str(e)
+                logger.error(f"[STARTUP] ❌ {name} falhou (tentativa {state.attempts}): {e}")
+                if retry_interval is None:
+                    return False
+                await asyncio.sleep(retry_interval)
+                continue
+
+            state.status = READY
+            state.error = None
+            state.details = details if isinstance(details, dict) else None
+            state.seconds = round(time.perf_counter() - start, 3)
+            state.ready_at = time.time()
+            logger.info(f"[STARTUP] ✅ {name} pronto em {state.seconds:.2f}s")
+            return True
+
+    def report(self) -> Dict:
+        return {
+            "ready": self.ready(),
+            "required": list(self.required),
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "components": {name: state.to_dict() for name, state in self._states.items()},
+        }
+
+
+components = ComponentRegistry(("tts", "db", "g2p", "whisper", "warmup"))
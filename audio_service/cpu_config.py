@@ -0,0 +1,83 @@
+"""
+Threads e afinidade de CPU do serviço de áudio
+
+Importado antes do NumPy/librosa: as bibliotecas nativas (OpenBLAS/MKL,
+OpenMP do numba) leem o número de threads do environment ao carregar.
+Sem limites, as threads do CTranslate2 (Whisper) e as do lado NumPy/librosa
+competem pelos mesmos cores e a latência torna-se irregular.
+
+- AUDIO_NUMPY_THREADS: threads de OpenBLAS/MKL/OpenMP/numba (por omissão 1;
+  a análise acústica de um clip curto não ganha com paralelismo interno)
+- CPU_AFFINITY: cores dos processos HTTP, ex. "0-3,8" (vazio = sem pinning)
+- WHISPER_CPU_AFFINITY: cores do processo servidor do modelo (multi-worker)
+"""
+import logging
+import os
+from typing import Optional, Set
+
+logger = logging.getLogger(__name__)
+
+AUDIO_NUMPY_THREADS = os.getenv("AUDIO_NUMPY_THREADS", "1")
+CPU_AFFINITY = os.getenv("CPU_AFFINITY", "")
+WHISPER_CPU_AFFINITY = os.getenv("WHISPER_CPU_AFFINITY", "")
+
+_THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "NUMBA_NUM_THREADS",
+)
+
+
+def configure_thread_pools(threads: str = AUDIO_NUMPY_THREADS):
+    """Limita os thread pools nativos (valores já definidos no environment prevalecem)"""
+    for name in _THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(threads))
+
+
+def parse_cpu_list(spec: str) -> Set[int]:
+    """'0-3,8,10-11' -> {0, 1, 2, 3, 8, 10, 11}"""
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+
+def apply_affinity(spec: str, label: str = "processo") -> Optional[Set[int]]:
+    """Fixa o processo atual (e as threads que criar) aos cores indicados"""
+    if not spec:
+        return None
+    if not hasattr(os, "sched_setaffinity"):
+        logger.warning("[CPU] Afinidade de CPU não suportada nesta plataforma")
+        return None
+    try:
+        cpus = parse_cpu_list(spec)
+        os.sched_setaffinity(0, cpus)
+        logger.info(f"[CPU] {label} fixado aos cores {sorted(cpus)}")
+        return cpus
+    except (ValueError, OSError) as e:
+        logger.warning(f"[CPU] Afinidade '{spec}' inválida: {e}")
+        return None
+
+
+def available_cpus() -> int:
+    """Cores utilizáveis pelo processo (respeita a afinidade e o cpuset do contentor)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def summary() -> dict:
+    return {
+        "available_cpus": available_cpus(),
+        "affinity": sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None,
+        "thread_pools": {name: os.environ.get(name) for name in _THREAD_ENV_VARS},
+    }
@@ -0,0 +1,543 @@
+"""
+Base de dados (PostgreSQL) das avaliações importadas pela Qualidade
+"""
+import csv
+import io
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, Float, Numeric, DateTime, Index, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+if not DATABASE_URL:
+    # O serviço arranca na mesma: só o componente "db" fica indisponível
+    logger.error("[DB] DATABASE_URL não definida no environment")
+
+# Linhas enviadas por cada COPY durante a importação Excel
+IMPORT_BATCH_SIZE = int(os.getenv("EXCEL_IMPORT_BATCH_SIZE", "5000"))
+
+# Pool das consultas da API (engine assíncrono, asyncpg)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Tempo máximo de cada statement das consultas da API (ms, 0 = sem limite)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+
+
+def _sync_engine_url(url: str):
+    """postgresql:// sem driver fica no psycopg2 instalado na imagem"""
+    url = make_url(url)
+    if url.drivername == "postgresql":
+        url = url.set(drivername="postgresql+psycopg2")
+    return url
+
+
+def _async_engine_args(url: str) -> Tuple[object, Dict]:
+    """
+    URL asyncpg a partir do DATABASE_URL (postgresql://...)
+    O asyncpg não aceita `sslmode` na query: passa para connect_args["ssl"]
+    """
+    url = make_url(url)
+    query = dict(url.query)
+    connect_args = {
+        "server_settings": {
+            "application_name": "audio_service",
+            "statement_timeout": str(DB_STATEMENT_TIMEOUT_MS),
+        }
+    }
+    sslmode = query.pop("sslmode", None)
+    if sslmode:
+        connect_args["ssl"] = sslmode
+    return url.set(drivername="postgresql+asyncpg", query=query), connect_args
+
+
+# Contadores do pool assíncrono (expostos em /db/pool)
+_pool_counters = {"connects": 0, "checkouts": 0, "invalidated": 0}
+
+
+def _on_connect(dbapi_connection, connection_record):
+    _pool_counters["connects"] += 1
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    _pool_counters["checkouts"] += 1
+
+
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    _pool_counters["invalidated"] += 1
+
+
+# Nenhum dos engines liga ao Postgres aqui: a primeira ligação acontece
+# em init_db() (arranque em background) ou no primeiro pedido
+engine = None
+async_engine = None
+if DATABASE_URL:
+    # Engine síncrono: importações Excel (COPY) nos workers e criação das tabelas
+    engine = create_engine(
+        _sync_engine_url(DATABASE_URL),
+        pool_size=2,
+        max_overflow=0,
+        pool_pre_ping=True,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+
+    _async_url, _async_connect_args = _async_engine_args(DATABASE_URL)
+    async_engine = create_async_engine(
+        _async_url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        connect_args=_async_connect_args,
+    )
+    event.listen(async_engine.sync_engine, "connect", _on_connect)
+    event.listen(async_engine.sync_engine, "checkout", _on_checkout)
+    event.listen(async_engine.sync_engine, "invalidate", _on_invalidate)
+
+SessionLocal = sessionmaker(bind=engine)
+
+
+def pool_stats() -> Dict:
+    """Estado atual do pool das consultas da API"""
+    if async_engine is None:
+        return {"configured": False}
+    pool = async_engine.pool
+    return {
+        "configured": True,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "timeout": DB_POOL_TIMEOUT,
+        "statement_timeout_ms": DB_STATEMENT_TIMEOUT_MS,
+        **_pool_counters,
+    }
+
+Base = declarative_base()
+
+
+class AvaliacaoAluno(Base):
+    __tablename__ = "avaliacoes_alunos"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    ano_letivo = Column(String, nullable=False)
+    periodo = Column(String, nullable=False)
+    ano = Column(String, nullable=False)
+    turma = Column(String, nullable=False)
+    disciplina = Column(String, nullable=False)
+    total_alunos = Column(Integer)
+    total_positivos = Column(Integer)
+    percent_positivos = Column(Float)
+    total_negativos = Column(Integer)
+    percent_negativos = Column(Float)
+    ciclo = Column(String, nullable=False)
+    classificacoes = Column(JSONB, nullable=False)
+    sheet_name = Column(String)
+    created_at = Column(DateTime, server_default=func.now())
+    media = Column(Numeric(4, 2), nullable=True)  # ⬅️ ESTE CAMPO É ESSENCIAL
+
+    __table_args__ = (
+        # Chave natural usada pelo upsert da importação Excel
+        Index(
+            "uq_avaliacoes_chave_natural",
+            "ano_letivo", "periodo", "turma", "disciplina",
+            unique=True,
+        ),
+    )
+
+
+class ImportacaoSheet(Base):
+    """Hash do conteúdo de cada sheet já importada, por ano letivo e período"""
+    __tablename__ = "avaliacoes_importacoes_sheets"
+
+    ano_letivo = Column(String, primary_key=True)
+    periodo = Column(String, primary_key=True)
+    sheet_name = Column(String, primary_key=True)
+    content_hash = Column(String, nullable=False)
+    registos = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
+# ============================================
+# ROLLUPS ANALÍTICOS
+# Agregados pré-calculados por (ano_letivo, periodo), atualizados pela
+# importação apenas para as fatias que ela escreveu
+# ============================================
+class RollupMedidas:
+    """Medidas aditivas: podem voltar a ser somadas em qualquer agrupamento"""
+    registos = Column(Integer, nullable=False, default=0)
+    total_alunos = Column(Integer, nullable=False, default=0)
+    total_positivos = Column(Integer, nullable=False, default=0)
+    total_negativos = Column(Integer, nullable=False, default=0)
+    soma_percent_positivos = Column(Float, nullable=False, default=0)
+    registos_com_percent = Column(Integer, nullable=False, default=0)
+    soma_media_ponderada = Column(Numeric, nullable=True)
+    alunos_com_media = Column(Integer, nullable=True)
+    classificacoes = Column(JSONB, nullable=False)
+    updated_at = Column(DateTime, server_default=func.now())
+
+
+class AvaliacaoRollupDisciplina(RollupMedidas, Base):
+    """Por ano letivo / período / ciclo / ano / disciplina"""
+    __tablename__ = "avaliacoes_rollup_disciplina"
+
+    ano_letivo = Column(String, primary_key=True)
+    periodo = Column(String, primary_key=True)
+    ciclo = Column(String, primary_key=True)
+    ano = Column(String, primary_key=True)
+    disciplina = Column(String, primary_key=True)
+
+
+class AvaliacaoRollupTurma(RollupMedidas, Base):
+    """Por turma ao longo do tempo (ano letivo / período)"""
+    __tablename__ = "avaliacoes_rollup_turma"
+
+    ano_letivo = Column(String, primary_key=True)
+    periodo = Column(String, primary_key=True)
+    ciclo = Column(String, primary_key=True)
+    ano = Column(String, primary_key=True)
+    turma = Column(String, primary_key=True)
+
+
+ROLLUPS = {
+    AvaliacaoRollupDisciplina.__tablename__: ("ano_letivo", "periodo", "ciclo", "ano", "disciplina"),
+    AvaliacaoRollupTurma.__tablename__: ("ano_letivo", "periodo", "ciclo", "ano", "turma"),
+}
+
+ROLLUP_MEASURES = (
+    "registos", "total_alunos", "total_positivos", "total_negativos",
+    "soma_percent_positivos", "registos_com_percent",
+    "soma_media_ponderada", "alunos_com_media",
+)
+
+# Medidas calculadas a partir das linhas de avaliacoes_alunos ...
+_BASE_MEASURES_SQL = """
+    COUNT(*) AS registos,
+    COALESCE(SUM(total_alunos), 0) AS total_alunos,
+    COALESCE(SUM(total_positivos), 0) AS total_positivos,
+    COALESCE(SUM(total_negativos), 0) AS total_negativos,
+    COALESCE(SUM(percent_positivos), 0) AS soma_percent_positivos,
+    COUNT(percent_positivos) AS registos_com_percent,
+    SUM(media * total_alunos) FILTER (WHERE media IS NOT NULL) AS soma_media_ponderada,
+    SUM(total_alunos) FILTER (WHERE media IS NOT NULL) AS alunos_com_media
+"""
+
+# ... ou reagregadas a partir de um rollup
+_ROLLUP_MEASURES_SQL = ",\n".join(f"    SUM({m}) AS {m}" for m in ROLLUP_MEASURES)
+
+
+def aggregate_sql(source: str, groups: Sequence[str], where: str = "", from_rollup: bool = False) -> str:
+    """
+    SELECT agregado por `groups` com as medidas aditivas e o histograma
+    `classificacoes` somado chave a chave (jsonb_each_text)
+    """
+    cols = ", ".join(groups)
+    measures = _ROLLUP_MEASURES_SQL if from_rollup else _BASE_MEASURES_SQL
+    join_on = " AND ".join(f"t.{g} = h.{g}" for g in groups)
+    return f"""
+        WITH base AS (
+            SELECT * FROM {source} {where}
+        ),
+        totais AS (
+            SELECT {cols}, {measures}
+            FROM base
+            GROUP BY {cols}
+        ),
+        niveis AS (
+            SELECT {cols}, kv.key, SUM(kv.value::numeric) AS n
+            FROM base, jsonb_each_text(base.classificacoes) AS kv
+            GROUP BY {cols}, kv.key
+        ),
+        histogramas AS (
+            SELECT {cols}, jsonb_object_agg(key, n) AS classificacoes
+            FROM niveis
+            GROUP BY {cols}
+        )
+        SELECT t.*, COALESCE(h.classificacoes, '{{}}'::jsonb) AS classificacoes
+        FROM totais t
+        LEFT JOIN histogramas h ON {join_on}
+    """
+
+
+def refresh_rollups(conn, slices: Iterable[Tuple[str, str]]):
+    """
+    Recalcula os rollups apenas para as fatias (ano_letivo, periodo) indicadas
+    Deve ser chamado dentro da transação que escreveu os dados
+    """
+    for ano_letivo, periodo in sorted(set(slices)):
+        params = {"ano_letivo": ano_letivo, "periodo": periodo}
+        where = "WHERE ano_letivo = :ano_letivo AND periodo = :periodo"
+        for table, keys in ROLLUPS.items():
+            conn.execute(text(f"DELETE FROM {table} {where}"), params)
+            columns = ", ".join((*keys, *ROLLUP_MEASURES, "classificacoes"))
+            conn.execute(text(
+                f"INSERT INTO {table} ({columns}) "
+                f"SELECT {columns} FROM ({aggregate_sql(AvaliacaoAluno.__tablename__, keys, where)}) agregados"
+            ), params)
+        logger.info(f"[DB] Rollups atualizados para {ano_letivo}/{periodo}")
+
+
+def rebuild_rollups():
+    """Recalcula todos os rollups (todas as fatias existentes)"""
+    with engine.begin() as conn:
+        slices = conn.execute(text(
+            f"SELECT DISTINCT ano_letivo, periodo FROM {AvaliacaoAluno.__tablename__}"
+        )).fetchall()
+        for table in ROLLUPS:
+            conn.execute(text(f"DELETE FROM {table}"))
+        refresh_rollups(conn, [tuple(row) for row in slices])
+
+
+def rollup_for(groups: Sequence[str]) -> Optional[str]:
+    """Rollup mais pequeno que cobre o agrupamento e os filtros pedidos"""
+    for table, keys in ROLLUPS.items():
+        if set(groups) <= set(keys):
+            return table
+    return None
+
+
+def init_db():
+    """
+    Liga ao Postgres e cria as tabelas em falta
+    Chamado no arranque em background (com novas tentativas), nunca no import
+    """
+    if engine is None:
+        raise RuntimeError("DATABASE_URL não definida no environment")
+    Base.metadata.create_all(engine)
+    check_natural_key()
+    check_rollups()
+
+
+def check_natural_key():
+    """
+    create_all não acrescenta índices a tabelas que já existem: sem o índice
+    único da chave natural os INSERT ... ON CONFLICT da importação falham
+    """
+    table = AvaliacaoAluno.__tablename__
+    inspector = inspect(engine)
+    unique_keys = [tuple(index["column_names"]) for index in inspector.get_indexes(table) if index.get("unique")]
+    unique_keys += [tuple(constraint["column_names"]) for constraint in inspector.get_unique_constraints(table)]
+    if not any(set(key) == set(NATURAL_KEY) for key in unique_keys):
+        raise RuntimeError(
+            f"Falta o índice único uq_avaliacoes_chave_natural em {table} ({', '.join(NATURAL_KEY)}): "
+            "correr migration_avaliacoes_chave_natural.sql"
+        )
+
+
+def check_rollups():
+    """
+    Sem migration_avaliacoes_rollups.sql o create_all cria os rollups vazios e
+    /agregados deixaria de ver os dados já importados: recalcula-os no arranque
+    (com vários workers, um recálculo concorrente falha e a nova tentativa do
+    componente encontra-os preenchidos)
+    """
+    with engine.connect() as conn:
+        vazios = [
+            table for table in ROLLUPS
+            if conn.execute(text(f"SELECT 1 FROM {table} LIMIT 1")).first() is None
+        ]
+        if not vazios or conn.execute(
+            text(f"SELECT 1 FROM {AvaliacaoAluno.__tablename__} LIMIT 1")
+        ).first() is None:
+            return
+    logger.warning(f"[DB] Rollups vazios ({', '.join(vazios)}) com avaliações importadas: a recalcular")
+    rebuild_rollups()
+
+
+# Colunas escritas pela importação (id e created_at ficam a cargo do Postgres)
+IMPORT_COLUMNS = (
+    "ano_letivo", "periodo", "ano", "turma", "disciplina",
+    "total_alunos", "total_positivos", "percent_positivos",
+    "total_negativos", "percent_negativos", "ciclo",
+    "classificacoes", "sheet_name", "media",
+)
+NATURAL_KEY = ("ano_letivo", "periodo", "turma", "disciplina")
+
+
+def _chunks(registos: List[Dict], size: int) -> Iterable[List[Dict]]:
+    for start in range(0, len(registos), size):
+        yield registos[start:start + size]
+
+
+def _slices(registos: List[Dict]) -> Set[Tuple[str, str]]:
+    return {(registo["ano_letivo"], registo["periodo"]) for registo in registos}
+
+
+def _copy_buffer(registos: List[Dict]) -> io.StringIO:
+    """
+    Serializa um lote em CSV para o COPY
+    Strings vão entre aspas (texto vazio != NULL) e classificacoes é
+    convertido para JSON uma única vez por linha
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC, lineterminator="\n")
+    for registo in registos:
+        row = [registo.get(column) for column in IMPORT_COLUMNS]
+        row[IMPORT_COLUMNS.index("classificacoes")] = json.dumps(registo["classificacoes"])
+        writer.writerow(row)
+    buffer.seek(0)
+    return buffer
+
+
+def _copy_from(cursor, copy_sql: str, buffer: io.StringIO):
+    """COPY FROM STDIN compatível com psycopg2 e psycopg 3"""
+    if hasattr(cursor, "copy_expert"):
+        cursor.copy_expert(copy_sql, buffer)
+    else:
+        with cursor.copy(copy_sql) as copy:
+            copy.write(buffer.getvalue())
+
+
+def bulk_insert_avaliacoes(registos: List[Dict], batch_size: int = IMPORT_BATCH_SIZE) -> Dict:
+    """
+    Modo append: acrescenta só as linhas cuja chave natural ainda não existe
+    (COPY para uma tabela temporária e INSERT ... ON CONFLICT DO NOTHING);
+    as linhas existentes nunca são alteradas. Lotes de `batch_size` linhas
+    numa única transação
+    """
+    start = time.perf_counter()
+    table = AvaliacaoAluno.__tablename__
+    columns = ", ".join(IMPORT_COLUMNS)
+    insert_sql = (
+        f"INSERT INTO {table} ({columns}) SELECT {columns} FROM avaliacoes_staging "
+        f"ON CONFLICT ({', '.join(NATURAL_KEY)}) DO NOTHING RETURNING 1"
+    )
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TEMP TABLE avaliacoes_staging ON COMMIT DROP AS "
+            f"SELECT {columns} FROM {table} WITH NO DATA"
+        ))
+        cursor = conn.connection.cursor()
+        try:
+            copy_sql = f"COPY avaliacoes_staging ({columns}) FROM STDIN WITH (FORMAT csv)"
+            for lote in _chunks(registos, max(1, batch_size)):
+                _copy_from(cursor, copy_sql, _copy_buffer(lote))
+        finally:
+            cursor.close()
+
+        inseridos = len(conn.execute(text(insert_sql)).fetchall())
+        if inseridos:
+            refresh_rollups(conn, _slices(registos))
+
+    seconds = time.perf_counter() - start
+    rows_per_sec = len(registos) / seconds if seconds > 0 else 0.0
+    logger.info(
+        f"[DB] Append: {inseridos}/{len(registos)} linhas novas em {seconds:.2f}s ({rows_per_sec:.0f} linhas/s)"
+    )
+
+    return {
+        "rows": inseridos,
+        "existing": len(registos) - inseridos,
+        "batch_size": batch_size,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows_per_sec, 1),
+    }
+
+
+def get_sheet_hashes(ano_letivo: str, periodo: str) -> Dict[str, ImportacaoSheet]:
+    """Hashes das sheets importadas anteriormente para o (ano_letivo, periodo)"""
+    db = SessionLocal()
+    try:
+        sheets = db.query(ImportacaoSheet).filter(
+            ImportacaoSheet.ano_letivo == ano_letivo,
+            ImportacaoSheet.periodo == periodo,
+        ).all()
+        return {sheet.sheet_name: sheet for sheet in sheets}
+    finally:
+        db.close()
+
+
+def upsert_avaliacoes(
+    registos: List[Dict],
+    ano_letivo: str,
+    periodo: str,
+    sheet_hashes: Dict[str, Dict],
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> Dict:
+    """
+    Importação idempotente: COPY para uma tabela temporária e
+    INSERT ... ON CONFLICT DO UPDATE na chave natural. Linhas iguais às
+    existentes não são reescritas. Os hashes das sheets são gravados na
+    mesma transação.
+    `sheet_hashes`: {sheet_name: {"content_hash": ..., "registos": ...}}
+    """
+    start = time.perf_counter()
+    table = AvaliacaoAluno.__tablename__
+    columns = ", ".join(IMPORT_COLUMNS)
+    key = ", ".join(NATURAL_KEY)
+    updatable = [column for column in IMPORT_COLUMNS if column not in NATURAL_KEY]
+    upsert_sql = (
+        f"INSERT INTO {table} ({columns}) SELECT {columns} FROM avaliacoes_staging "
+        f"ON CONFLICT ({key}) DO UPDATE SET "
+        + ", ".join(f"{column} = EXCLUDED.{column}" for column in updatable)
+        + f" WHERE ({', '.join(f'{table}.{c}' for c in updatable)}) "
+        f"IS DISTINCT FROM ({', '.join(f'EXCLUDED.{c}' for c in updatable)}) "
+        "RETURNING (xmax = 0) AS inserted"
+    )
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TEMP TABLE avaliacoes_staging ON COMMIT DROP AS "
+            f"SELECT {columns} FROM {table} WITH NO DATA"
+        ))
+        cursor = conn.connection.cursor()
+        try:
+            copy_sql = f"COPY avaliacoes_staging ({columns}) FROM STDIN WITH (FORMAT csv)"
+            for lote in _chunks(registos, max(1, batch_size)):
+                _copy_from(cursor, copy_sql, _copy_buffer(lote))
+        finally:
+            cursor.close()
+
+        escritos = [row.inserted for row in conn.execute(text(upsert_sql))]
+        if escritos:
+            refresh_rollups(conn, [(ano_letivo, periodo)])
+
+        for sheet_name, info in sheet_hashes.items():
+            conn.execute(text(
+                f"INSERT INTO {ImportacaoSheet.__tablename__} "
+                "(ano_letivo, periodo, sheet_name, content_hash, registos, updated_at) "
+                "VALUES (:ano_letivo, :periodo, :sheet_name, :content_hash, :registos, now()) "
+                "ON CONFLICT (ano_letivo, periodo, sheet_name) DO UPDATE SET "
+                "content_hash = EXCLUDED.content_hash, registos = EXCLUDED.registos, updated_at = now()"
+            ), {
+                "ano_letivo": ano_letivo,
+                "periodo": periodo,
+                "sheet_name": sheet_name,
+                "content_hash": info["content_hash"],
+                "registos": info["registos"],
+            })
+
+    inserted = sum(1 for flag in escritos if flag)
+    updated = len(escritos) - inserted
+    unchanged = len(registos) - len(escritos)
+
+    seconds = time.perf_counter() - start
+    rows_per_sec = len(registos) / seconds if seconds > 0 else 0.0
+    logger.info(
+        f"[DB] Upsert: {inserted} inseridos, {updated} atualizados, {unchanged} inalterados "
+        f"em {seconds:.2f}s ({rows_per_sec:.0f} linhas/s)"
+    )
+
+    return {
+        "rows": len(registos),
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": unchanged,
+        "batch_size": batch_size,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows_per_sec, 1),
+    }
@@ -0,0 +1,460 @@
+"""
+Avaliação em lote de gravações (reavaliar uma turma com outros limiares)
+
+Recebe um arquivo .zip (ou uma pasta dentro de EVALUATION_ROOT) com os
+clips e um `manifest.csv`:
+
+    file,expected_text[,id][,card_type][,threshold][,language][,stt_backend]
+
+`stt_backend` (coluna ou parâmetro do pedido) escolhe o motor STT de cada
+clip (ver stt_backends): o mesmo conjunto avaliado com dois motores dá a
+comparação de latência e acerto entre eles.
+
+Cada clip passa pelo mesmo pipeline das revisões (review_pipeline: descodificação,
+melhoria, corte do silêncio, análise acústica, Whisper, avaliação do tipo
+de cartão) num process pool, sem efeitos secundários: não grava revisões
+nem gera TTS. O resultado é uma tabela CSV/Parquet com uma linha por clip
+e os tempos de cada fase.
+
+Os processos de avaliação correm com `nice` e cedem o CPU enquanto houver
+revisões interativas em curso (como as importações Excel).
+"""
+import csv
+import importlib.util
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import stt_backends
+from model_server import shared_dict
+from review_pipeline import CARD_TYPE_CONFIGS, CORE_STAGES, STAGE_NAMES, ReviewContext, ReviewPipeline
+
+logger = logging.getLogger(__name__)
+
+EVALUATION_WORKERS = int(os.getenv("EVALUATION_WORKERS", "2"))
+# Pasta do servidor de onde se podem avaliar gravações sem upload (vazio = desativado)
+EVALUATION_ROOT = os.getenv("EVALUATION_ROOT", "")
+EVALUATION_RESULTS_DIR = Path(os.getenv("EVALUATION_RESULTS_DIR", os.path.join(tempfile.gettempdir(), "evaluation_results")))
+EVALUATION_MAX_CLIPS = int(os.getenv("EVALUATION_MAX_CLIPS", "5000"))
+# Tamanho máximo do .zip depois de descomprimido (verificado antes de extrair)
+EVALUATION_MAX_ARCHIVE_MB = int(os.getenv("EVALUATION_MAX_ARCHIVE_MB", "2048"))
+# Token dos endpoints /evaluation/jobs (por omissão o mesmo do profiler; vazio = desativados)
+EVALUATION_TOKEN = os.getenv("EVALUATION_TOKEN") or os.getenv("PROFILER_TOKEN", "")
+EVALUATION_JOB_HISTORY = int(os.getenv("EVALUATION_JOB_HISTORY", "20"))
+EVALUATION_NICE = int(os.getenv("EVALUATION_NICE", "10"))
+
+CARD_TYPES = tuple(CARD_TYPE_CONFIGS)
+RESULT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+PARQUET_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+FINAL_STATES = ("done", "failed", "cancelled")
+STAGES = STAGE_NAMES
+RESULT_COLUMNS = [
+    "id", "file", "card_type", "expected_text", "threshold", "stt_backend", "transcription",
+    "normalized_transcription", "is_correct", "rating", "feedback_type",
+    "composite_score", "similarity_score", "phonetic_similarity", "has_voice",
+    "quality_ok", "duration_seconds", "error",
+] + [f"{stage}_ms" for stage in STAGES] + ["total_ms"]
+
+
+class ManifestError(ValueError):
+    """Arquivo ou manifest inválido"""
+
+
+# ============================================
+# PROCESSO WORKER
+# ============================================
+_interactive_pressure = None
+# Threads do Whisper carregado no worker e motores que falharam a carregar
+_stt_options: Dict = {}
+_stt_errors: Dict[str, str] = {}
+# Só as fases sem efeitos secundários (sem TTS nem registo da revisão)
+_pipeline = ReviewPipeline(CORE_STAGES)
+
+
+def _init_worker(interactive_pressure, num_workers: int):
+    """Carrega G2P e os motores STT por omissão uma vez por processo"""
+    global _interactive_pressure
+    import cpu_config
+
+    cpu_config.configure_thread_pools()
+    logging.basicConfig(level=logging.INFO)
+    _interactive_pressure = interactive_pressure
+    if EVALUATION_NICE and hasattr(os, "nice"):
+        os.nice(EVALUATION_NICE)
+
+    import speech_analysis
+
+    try:
+        speech_analysis.load_g2p()
+    except Exception as e:
+        logger.warning(f"[EVAL] G2P indisponível no worker: {e}")
+
+    # Whisper local (sem servidor do modelo): os cores divididos pelos workers
+    _stt_options.update(cpu_threads=max(1, cpu_config.available_cpus() // num_workers), num_workers=1)
+    try:
+        stt_backends.load_configured(CARD_TYPES, **_stt_options)
+    except Exception as e:
+        logger.error(f"[EVAL] STT indisponível no worker: {e}")
+
+
+def _stt_backend(spec: str) -> Optional[stt_backends.STTBackend]:
+    """Motor do clip, carregado na primeira utilização (None se não carregar)"""
+    if spec in _stt_errors:
+        return None
+    try:
+        return stt_backends.get(spec, **_stt_options)
+    except Exception as e:
+        logger.error(f"[EVAL] Motor STT '{spec}' indisponível: {e}")
+        _stt_errors[spec] = str(e)
+        return None
+
+
+def _yield_to_interactive(max_pause: float = 30.0):
+    if _interactive_pressure is None:
+        return
+    start = time.monotonic()
+    while _interactive_pressure.value and time.monotonic() - start < max_pause:
+        time.sleep(0.05)
+
+
+def evaluate_clip(clip: Dict) -> Dict:
+    """Pipeline de revisão de um clip, sem efeitos secundários; devolve uma linha da tabela"""
+    _yield_to_interactive()
+
+    row = {column: None for column in RESULT_COLUMNS}
+    row.update({k: clip[k] for k in ("id", "file", "card_type", "expected_text", "threshold", "stt_backend")})
+    ctx = ReviewContext(
+        config=CARD_TYPE_CONFIGS[clip["card_type"]],
+        expected_text=clip["expected_text"],
+        threshold=clip["threshold"],
+        language=clip["language"],
+        source_path=clip["path"],
+        stt=_stt_backend(clip["stt_backend"]),
+        tag="EVAL",
+    )
+    try:
+        _pipeline.run_sync(ctx)
+        acoustic_info = ctx.acoustic_info or {}
+        analysis = ctx.analysis or {}
+        row.update(
+            transcription=ctx.transcription,
+            normalized_transcription=ctx.normalized_transcription,
+            is_correct=ctx.is_correct,
+            rating=ctx.rating,
+            feedback_type=ctx.feedback_type,
+            composite_score=analysis.get("composite_score"),
+            similarity_score=analysis.get("content_similarity"),
+            phonetic_similarity=analysis.get("phonetic_similarity"),
+            has_voice=acoustic_info.get("has_voice"),
+            quality_ok=acoustic_info.get("quality_ok"),
+            duration_seconds=acoustic_info.get("duration_seconds"),
+        )
+    except Exception as e:
+        logger.error(f"[EVAL] Erro no clip {clip['file']}: {e}")
+        row["error"] = str(e)
+    finally:
+        ctx.cleanup()
+
+    for name in STAGES:
+        row[f"{name}_ms"] = ctx.timings.get(name)
+    row["total_ms"] = round(sum(ctx.timings.values()), 1)
+    return row
+
+
+# ============================================
+# MANIFEST E ARQUIVOS
+# ============================================
+def _find_manifest(root: Path) -> Path:
+    manifest = root / "manifest.csv"
+    if manifest.exists():
+        return manifest
+    candidates = sorted(root.rglob("manifest.csv")) or sorted(root.rglob("*.csv"))
+    if not candidates:
+        raise ManifestError("manifest.csv não encontrado")
+    return candidates[0]
+
+
+def read_manifest(
+    root: Path, card_type: str, threshold: Optional[float], language: str, stt_backend: Optional[str] = None
+) -> List[Dict]:
+    """Linhas do manifest -> clips (valores por omissão do pedido quando a coluna falta)"""
+    manifest = _find_manifest(root)
+    base = manifest.parent.resolve()
+    clips = []
+    with open(manifest, newline="", encoding="utf-8-sig") as f:
+        for line, record in enumerate(csv.DictReader(f), start=2):
+            file = (record.get("file") or "").strip()
+            expected_text = (record.get("expected_text") or "").strip()
+            if not file or not expected_text:
+                raise ManifestError(f"Linha {line}: 'file' e 'expected_text' são obrigatórios")
+            path = (base / file).resolve()
+            if base not in path.parents or not path.is_file():
+                raise ManifestError(f"Linha {line}: clip '{file}' não encontrado")
+            tipo = (record.get("card_type") or card_type).strip()
+            if tipo not in CARD_TYPES:
+                raise ManifestError(f"Linha {line}: card_type deve ser um de {list(CARD_TYPES)}")
+            try:
+                limiar = float(record.get("threshold") or (threshold if threshold is not None else CARD_TYPE_CONFIGS[tipo].default_threshold))
+            except ValueError:
+                raise ManifestError(f"Linha {line}: threshold inválido")
+            try:
+                motor = (record.get("stt_backend") or stt_backend or "").strip()
+                motor = stt_backends.normalize_spec(motor) if motor else stt_backends.backend_spec(tipo)
+            except ValueError as e:
+                raise ManifestError(f"Linha {line}: {e}")
+            clips.append({
+                "id": (record.get("id") or "").strip() or str(line - 1),
+                "file": file,
+                "path": str(path),
+                "card_type": tipo,
+                "expected_text": expected_text,
+                "threshold": limiar,
+                "language": (record.get("language") or language).strip(),
+                "stt_backend": motor,
+            })
+    if not clips:
+        raise ManifestError("Manifest sem clips")
+    if len(clips) > EVALUATION_MAX_CLIPS:
+        raise ManifestError(f"Máximo de {EVALUATION_MAX_CLIPS} clips por job")
+    return clips
+
+
+def extract_archive(archive_path: str, destination: Path):
+    """
+    Extrai o .zip recusando caminhos fora da pasta de destino e arquivos que
+    descomprimidos excedem EVALUATION_MAX_ARCHIVE_MB (zip bombs)
+    """
+    destination = destination.resolve()
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            members = archive.infolist()
+            # file_size declarado: o zipfile não descomprime além dele
+            total_mb = sum(member.file_size for member in members) / 1024 / 1024
+            if total_mb > EVALUATION_MAX_ARCHIVE_MB:
+                raise ManifestError(
+                    f"Arquivo descomprimido com {total_mb:.0f} MB (máximo {EVALUATION_MAX_ARCHIVE_MB} MB)"
+                )
+            for member in members:
+                target = (destination / member.filename).resolve()
+                if target != destination and destination not in target.parents:
+                    raise ManifestError(f"Caminho inválido no arquivo: {member.filename}")
+            archive.extractall(destination)
+    except zipfile.BadZipFile:
+        raise ManifestError("Arquivo .zip inválido")
+
+
+def resolve_directory(directory: str) -> Path:
+    if not EVALUATION_ROOT:
+        raise ManifestError("Avaliação de pastas do servidor desativada (EVALUATION_ROOT)")
+    root = Path(EVALUATION_ROOT).resolve()
+    path = (root / directory).resolve()
+    if (path != root and root not in path.parents) or not path.is_dir():
+        raise ManifestError(f"Pasta '{directory}' não encontrada em EVALUATION_ROOT")
+    return path
+
+
+# ============================================
+# JOBS
+# ============================================
+class EvaluationJobManager:
+    """
+    Jobs de avaliação: um coordenador (thread) por vez distribui os clips
+    pelo process pool, publica o progresso e escreve a tabela de resultados
+    """
+
+    def __init__(self, max_workers: int = EVALUATION_WORKERS, history: int = EVALUATION_JOB_HISTORY):
+        self.max_workers = max_workers
+        self.history = history
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._coordinator: Optional[ThreadPoolExecutor] = None
+        self._jobs = None
+        self._lock = threading.Lock()
+
+    def _attach(self):
+        """Vários workers HTTP: estado no servidor partilhado, consultável em qualquer worker"""
+        if self._jobs is None:
+            self._jobs = shared_dict("evaluation_jobs")
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._pool is None:
+                from scheduler import cpu_scheduler
+
+                self._attach()
+                if self._jobs is None:
+                    self._jobs = {}
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(cpu_scheduler.interactive_pressure, self.max_workers),
+                )
+                self._coordinator = ThreadPoolExecutor(max_workers=1, thread_name_prefix="evaluation")
+                EVALUATION_RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+                logger.info(f"[EVAL] Process pool iniciado ({self.max_workers} worker(s))")
+
+    def _update(self, job_id: str, **campos):
+        state = self._jobs[job_id]
+        state.update(campos)
+        self._jobs[job_id] = state
+
+    def submit(self, clips: List[Dict], workdir: Optional[str], result_format: str, source: str) -> Dict:
+        self._ensure_started()
+        self._prune()
+
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = {
+            "job_id": job_id,
+            "status": "queued",
+            "source": source,
+            "format": result_format,
+            "clips_total": len(clips),
+            "clips_done": 0,
+            "clips_failed": 0,
+            "summary": None,
+            "result_file": None,
+            "error": None,
+            "cancel_requested": False,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        self._coordinator.submit(self._run, job_id, clips, workdir, result_format)
+        logger.info(f"[EVAL] Job {job_id} em fila ({len(clips)} clips de {source})")
+        return self.get(job_id)
+
+    def _cancel_requested(self, job_id: str) -> bool:
+        return self._jobs[job_id].get("cancel_requested", False)
+
+    def _run(self, job_id: str, clips: List[Dict], workdir: Optional[str], result_format: str):
+        try:
+            if self._cancel_requested(job_id):
+                self._update(job_id, status="cancelled", finished_at=time.time())
+                return
+            self._update(job_id, status="running", started_at=time.time())
+
+            # Resultados pela ordem do manifest
+            results: List[Optional[Dict]] = [None] * len(clips)
+            futures = {self._pool.submit(evaluate_clip, clip): i for i, clip in enumerate(clips)}
+            pending = set(futures)
+            done_count = failed = 0
+            while pending:
+                done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[futures[future]] = future.result()
+                    done_count += 1
+                    failed += bool(future.result()["error"])
+                if done:
+                    self._update(job_id, clips_done=done_count, clips_failed=failed)
+                if self._cancel_requested(job_id):
+                    for future in pending:
+                        future.cancel()
+                    self._update(job_id, status="cancelled", finished_at=time.time())
+                    logger.info(f"[EVAL] Job {job_id} cancelado")
+                    return
+
+            rows = [row for row in results if row is not None]
+            result_file = write_results(rows, EVALUATION_RESULTS_DIR / f"{job_id}.{RESULT_FORMATS[result_format][1]}", result_format)
+            self._update(
+                job_id,
+                status="done",
+                summary=summarize(rows),
+                result_file=str(result_file),
+                finished_at=time.time(),
+            )
+            logger.info(f"[EVAL] Job {job_id} concluído ({len(rows)} clips)")
+        except Exception as e:
+            logger.error(f"[EVAL] Job {job_id} falhou: {e}", exc_info=True)
+            self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+        finally:
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        self._attach()
+        if self._jobs is None:
+            return None
+        state = self._jobs.get(job_id)
+        return dict(state) if state is not None else None
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        state = self.get(job_id)
+        if state is None:
+            return None
+        if state["status"] not in FINAL_STATES:
+            self._update(job_id, cancel_requested=True)
+        return self.get(job_id)
+
+    def _prune(self):
+        terminados = sorted(
+            (state["finished_at"], job_id)
+            for job_id, state in self._jobs.items()
+            if state["status"] in FINAL_STATES
+        )
+        for _, job_id in terminados[:max(0, len(terminados) - self.history)]:
+            result_file = self._jobs[job_id].get("result_file")
+            if result_file and os.path.exists(result_file):
+                os.unlink(result_file)
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._coordinator.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def write_results(rows: List[Dict], path: Path, result_format: str) -> Path:
+    import pandas as pd
+
+    df = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    if result_format == "parquet":
+        df.to_parquet(path, index=False, compression="zstd")
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+
+def summarize(rows: List[Dict]) -> Dict:
+    """Acertos por tipo de cartão e por motor STT e tempo médio de cada fase"""
+    avaliados = [row for row in rows if not row["error"]]
+    por_tipo: Dict[str, Dict] = {}
+    por_motor: Dict[str, Dict] = {}
+    for row in avaliados:
+        for grupos, chave in ((por_tipo, row["card_type"]), (por_motor, row["stt_backend"])):
+            grupo = grupos.setdefault(chave, {"clips": 0, "correct": 0})
+            grupo["clips"] += 1
+            grupo["correct"] += int(bool(row["is_correct"]))
+    for motor, grupo in por_motor.items():
+        valores = [row["transcribe_ms"] for row in avaliados if row["stt_backend"] == motor and row["transcribe_ms"] is not None]
+        grupo["mean_transcribe_ms"] = round(sum(valores) / len(valores), 1) if valores else None
+
+    stage_ms = {}
+    for name in STAGES + ("total",):
+        valores = [row[f"{name}_ms"] for row in avaliados if row[f"{name}_ms"] is not None]
+        if valores:
+            stage_ms[name] = round(sum(valores) / len(valores), 1)
+
+    return {
+        "clips": len(rows),
+        "errors": len(rows) - len(avaliados),
+        "card_types": por_tipo,
+        "stt_backends": por_motor,
+        "mean_stage_ms": stage_ms,
+    }
+
+
+evaluation_jobs = EvaluationJobManager()
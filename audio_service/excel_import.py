@@ -0,0 +1,385 @@
+"""
+Importação de ficheiros Excel de avaliações (Qualidade)
+Pipeline orientado a colunas: cada sheet é normalizada uma vez e as
+classificações, totais, negativos e médias são calculados com NumPy
+"""
+import hashlib
+import logging
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Lista de disciplinas a IGNORAR
+DISCIPLINAS_IGNORADAS = frozenset({
+    "português língua não materna",
+    "português lingua não materna",
+    "cidadania e desenvolvimento",
+    "classe de conjunto",
+    "formação musical",
+    "instrumento",
+    "assembleia de turma",
+    "apoio tutorial específico",
+    "aia por",
+    "apoio português língua não materna",
+    "motricidade",
+    "atividades da vida diária",
+    "coadj",
+    "artes tradicionais",
+    "ciências experimentais",
+    "educação especial",
+    "aia mat",
+    "compensação curricular",
+    "aia",
+    "apoio ao estudo",
+    "oferta complementar",
+    "educação moral e religiosa",
+    "aec - atividade física",
+    "aec - expressão plástica",
+    "aec - atividade desportiva",
+    "aec - inglês",
+    "aec - música",
+    "aec - expressão dramática",
+    "apoio ao estudo de português",
+    "apoio educativo a matemática",
+    "apoio ao estudo de matemática",
+    "apoio educativo",
+    "aecc",
+    "aec - expressão artística",
+    "aec- atividade desportiva",
+    "aec-ensino do inglês",
+    "aia bio",
+    "aia - fqa",
+    "assembleia de turma com dt",
+    "apoio tutorial esp",
+    "aec-ensino da música",
+    "aec-artes plásticas",
+    "aec-educação física",
+    "oficina tic",
+    "português língua não materna b",
+    "classe conjunto",
+    "instrumento - piano",
+    "aia ing",
+    "esp acs",
+    "instrumento - trompete",
+    "apoioplnm",
+})
+
+# Incrementar quando a transformação mudar, para invalidar os hashes das sheets já importadas
+IMPORT_VERSION = 1
+
+# Escalas por ciclo: (chave em classificacoes, variantes do nome da coluna, peso na média)
+# - 1º ciclo: I=1, S=2, B=3, MB=4
+# - 2º/3º ciclo: níveis 1 a 5 (o Excel traz os cabeçalhos como '1', 1, ' 1' ou '1 ')
+# - Secundário: ponto médio de cada intervalo de valores
+_ESCALA_NIVEIS = tuple(
+    (str(i), (str(i), i, f" {i}", f"{i} "), float(i)) for i in range(1, 6)
+)
+
+CICLO_ESCALAS = {
+    "1_ciclo": (
+        ("I", ("I",), 1.0),
+        ("S", ("S",), 2.0),
+        ("B", ("B",), 3.0),
+        ("MB", ("MB",), 4.0),
+    ),
+    "2_ciclo": _ESCALA_NIVEIS,
+    "3_ciclo": _ESCALA_NIVEIS,
+    "secundario": (
+        ("1_7", ("1 - 7",), 4.0),
+        ("8_9", ("8 - 9",), 8.5),
+        ("10_13", ("10 - 13",), 11.5),
+        ("14_17", ("14 - 17",), 15.5),
+        ("18_20", ("18 - 20",), 19.0),
+    ),
+}
+
+
+def detect_ciclo(sheet_name: str) -> str:
+    """Determina o ciclo pelo nome da sheet"""
+    if "Basico 1" in sheet_name:
+        return "1_ciclo"
+    if "Basico 2" in sheet_name:
+        return "2_ciclo"
+    if "Basico 3" in sheet_name:
+        return "3_ciclo"
+    if "Secundario" in sheet_name:
+        return "secundario"
+    return "desconhecido"
+
+
+def _resolve_column(columns: pd.Index, candidates: Sequence) -> Optional[object]:
+    """Primeira variante do nome da coluna presente na sheet"""
+    for candidate in candidates:
+        if candidate in columns:
+            return candidate
+    return None
+
+
+def _numeric(df: pd.DataFrame, column) -> np.ndarray:
+    return pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=float)
+
+
+def _first_non_zero(df: pd.DataFrame, columns: Sequence[str]) -> np.ndarray:
+    """
+    Equivalente vetorial de `row.get(a) or row.get(b) or 0`:
+    usa a primeira coluna com valor preenchido e diferente de zero
+    """
+    result = np.zeros(len(df), dtype=float)
+    filled = np.zeros(len(df), dtype=bool)
+    for column in columns:
+        if column not in df.columns:
+            continue
+        values = _numeric(df, column)
+        take = ~filled & ~np.isnan(values) & (values != 0)
+        result[take] = values[take]
+        filled |= take
+    return result
+
+
+def transform_sheet(df: pd.DataFrame, sheet_name: str, ano_letivo: str, periodo: str) -> List[Dict]:
+    """
+    Converte uma sheet do Excel em registos de `avaliacoes_alunos`
+    """
+    df = df.dropna(how="all").reset_index(drop=True)
+    if df.empty or "Disciplina" not in df.columns or "Turma" not in df.columns:
+        return []
+
+    ciclo = detect_ciclo(sheet_name)
+
+    # 1. Filtrar linhas (disciplina válida, não ignorada, turma preenchida)
+    disciplina = df["Disciplina"].map(str).str.strip()
+    turma = df["Turma"].map(str)
+    mask = (
+        df["Disciplina"].notna().to_numpy()
+        & (disciplina != "").to_numpy()
+        & ~disciplina.str.lower().isin(DISCIPLINAS_IGNORADAS).to_numpy()
+        & (turma.str.strip() != "").to_numpy()
+    )
+
+    # 2. Totais
+    total_alunos = np.trunc(_first_non_zero(df, ("T. Alunos", "Nº Alunos"))).astype(np.int64)
+    total_positivos = np.trunc(_first_non_zero(df, ("T. Posit.", "T. Positivas"))).astype(np.int64)
+    percent_positivos = _first_non_zero(df, ("% Posit.", "% Positivas"))
+
+    # Ignorar registos sem avaliações positivas
+    mask &= percent_positivos != 0
+    if not mask.any():
+        return []
+
+    # 3. Negativos
+    total_negativos = np.where(total_alunos > 0, total_alunos - total_positivos, 0)
+    percent_negativos = np.where(percent_positivos > 0, 100 - percent_positivos, 0.0)
+
+    # 4. Classificações (colunas resolvidas uma única vez por sheet)
+    keys, columns, weights = [], [], []
+    for key, candidates, weight in CICLO_ESCALAS.get(ciclo, ()):
+        column = _resolve_column(df.columns, candidates)
+        if column is None:
+            continue
+        keys.append(key)
+        columns.append(np.trunc(_numeric(df, column)))
+        weights.append(weight)
+
+    matrix = np.column_stack(columns) if columns else np.empty((len(df), 0))
+    present = ~np.isnan(matrix)
+
+    # 5. Média ponderada pelo total de alunos (`total_alunos or 1`)
+    weighted = np.where(present, matrix, 0.0) @ np.asarray(weights, dtype=float)
+    denominador = np.where(total_alunos == 0, 1, total_alunos).astype(float)
+    media = np.divide(weighted, denominador, out=np.zeros(len(df)), where=denominador > 0)
+
+    # Secundário: prioridade para coluna 'Média' do Excel
+    if ciclo == "secundario" and "Média" in df.columns:
+        media_excel = _numeric(df, "Média")
+        media = np.where(np.isnan(media_excel), media, media_excel)
+
+    rows = np.flatnonzero(mask)
+
+    if ciclo in ("2_ciclo", "3_ciclo"):
+        sem_classificacoes = rows[~present[rows].any(axis=1)]
+        if len(sem_classificacoes):
+            colunas_numericas = [
+                c for c in df.columns
+                if isinstance(c, (int, float)) or (isinstance(c, str) and c.strip().isdigit())
+            ]
+            logger.warning(
+                f"[EXCEL] Ciclo {ciclo} - {len(sem_classificacoes)} linha(s) sem classificações "
+                f"em '{sheet_name}'. Colunas numéricas disponíveis: {colunas_numericas}"
+            )
+        media_zero = rows[(media[rows] == 0) & present[rows].any(axis=1)]
+        if len(media_zero):
+            logger.warning(
+                f"[EXCEL] Ciclo {ciclo} - {len(media_zero)} linha(s) com média calculada = 0 em '{sheet_name}'"
+            )
+
+    # 6. Registos
+    matrix_int = np.where(present, matrix, 0).astype(np.int64)
+    classificacoes = [
+        {key: int(matrix_int[i, j]) for j, key in enumerate(keys) if present[i, j]}
+        for i in rows
+    ]
+    anos = df["Ano"].map(str).to_numpy() if "Ano" in df.columns else np.full(len(df), "")
+    columns_out = {
+        "ano": anos[rows].tolist(),
+        "turma": turma.to_numpy()[rows].tolist(),
+        "disciplina": disciplina.to_numpy()[rows].tolist(),
+        "total_alunos": total_alunos[rows].tolist(),
+        "total_positivos": total_positivos[rows].tolist(),
+        "percent_positivos": percent_positivos[rows].tolist(),
+        "total_negativos": total_negativos[rows].tolist(),
+        "percent_negativos": percent_negativos[rows].tolist(),
+        "media": media[rows].tolist(),
+    }
+
+    return [
+        {
+            "ano_letivo": ano_letivo,
+            "periodo": periodo,
+            "ano": columns_out["ano"][k],
+            "turma": columns_out["turma"][k],
+            "disciplina": columns_out["disciplina"][k],
+            "total_alunos": columns_out["total_alunos"][k],
+            "total_positivos": columns_out["total_positivos"][k],
+            "percent_positivos": columns_out["percent_positivos"][k],
+            "total_negativos": columns_out["total_negativos"][k],
+            "percent_negativos": columns_out["percent_negativos"][k],
+            "ciclo": ciclo,
+            "classificacoes": classificacoes[k],
+            "sheet_name": sheet_name,
+            "media": columns_out["media"][k],
+        }
+        for k in range(len(rows))
+    ]
+
+
+def sheet_content_hash(df: pd.DataFrame) -> str:
+    """
+    Hash do conteúdo de uma sheet (cabeçalhos + valores)
+    Permite saltar sheets que não mudaram desde a última importação
+    """
+    df = df.dropna(how="all")
+    digest = hashlib.sha256(f"v{IMPORT_VERSION}|{list(map(str, df.columns))}".encode("utf-8"))
+    if not df.empty:
+        values = df.astype(object).where(df.notna(), None).map(str)
+        digest.update(pd.util.hash_pandas_object(values, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def dedupe_natural_key(registos: List[Dict]) -> List[Dict]:
+    """Mantém o último registo de cada (ano_letivo, periodo, turma, disciplina)"""
+    unicos = {}
+    for registo in registos:
+        key = (registo["ano_letivo"], registo["periodo"], registo["turma"], registo["disciplina"])
+        unicos[key] = registo
+    return list(unicos.values())
+
+
+def read_workbook(file) -> Dict[str, pd.DataFrame]:
+    """Lê todas as sheets do ficheiro Excel"""
+    return pd.read_excel(file, sheet_name=None, engine="openpyxl")
+
+
+def transform_workbook(excel_data: Dict[str, pd.DataFrame], ano_letivo: str, periodo: str) -> List[Dict]:
+    """Converte todas as sheets do workbook em registos de `avaliacoes_alunos`"""
+    registos = []
+    for sheet_name, df in excel_data.items():
+        registos.extend(transform_sheet(df, sheet_name, ano_letivo, periodo))
+    return registos
+
+
+class ImportCancelled(Exception):
+    """Importação cancelada a pedido do utilizador"""
+
+
+def run_import(
+    excel_data: Dict[str, pd.DataFrame],
+    ano_letivo: str,
+    periodo: str,
+    modo: str = "upsert",
+    progress: Optional[Callable[..., None]] = None,
+    should_cancel: Optional[Callable[[], bool]] = None,
+    throttle: Optional[Callable[[], None]] = None,
+) -> Dict:
+    """
+    Importa um workbook já lido para `avaliacoes_alunos`
+    - upsert: idempotente na chave natural; sheets com o mesmo hash são ignoradas
+    - append: acrescenta só linhas com chave natural nova; as existentes
+      ficam como estão (sem comparação de hashes nem atualização)
+    `progress(**campos)` recebe sheets_done, rows_skipped, rows_written e errors;
+    `should_cancel()` é consultado entre sheets e antes da escrita;
+    `throttle()` é chamado nos mesmos pontos e pode bloquear para ceder o CPU
+    """
+    from database import bulk_insert_avaliacoes, get_sheet_hashes, upsert_avaliacoes
+
+    progress = progress or (lambda **campos: None)
+    should_cancel = should_cancel or (lambda: False)
+    throttle = throttle or (lambda: None)
+
+    anteriores = get_sheet_hashes(ano_letivo, periodo) if modo == "upsert" else {}
+    registos, sheet_hashes, sheets_inalteradas, erros = [], {}, [], []
+    linhas_inalteradas = 0
+    linhas_ignoradas = 0
+
+    progress(fase="transformacao", sheets_total=len(excel_data))
+
+    for sheets_done, (sheet_name, df) in enumerate(excel_data.items(), start=1):
+        throttle()
+        if should_cancel():
+            raise ImportCancelled()
+
+        content_hash = sheet_content_hash(df)
+        anterior = anteriores.get(sheet_name)
+        if anterior is not None and anterior.content_hash == content_hash:
+            sheets_inalteradas.append(sheet_name)
+            linhas_inalteradas += anterior.registos
+        else:
+            try:
+                registos_sheet = transform_sheet(df, sheet_name, ano_letivo, periodo)
+            except Exception as e:
+                logger.error(f"[EXCEL] Erro na sheet '{sheet_name}': {e}")
+                erros.append(f"{sheet_name}: {e}")
+                registos_sheet = []
+            else:
+                sheet_hashes[sheet_name] = {"content_hash": content_hash, "registos": len(registos_sheet)}
+            linhas_ignoradas += len(df.dropna(how="all")) - len(registos_sheet)
+            registos.extend(registos_sheet)
+
+        progress(sheets_done=sheets_done, rows_skipped=linhas_ignoradas + linhas_inalteradas, errors=erros)
+
+    if sheets_inalteradas:
+        logger.info(f"[EXCEL] Sheets inalteradas (ignoradas): {sheets_inalteradas}")
+
+    throttle()
+    if should_cancel():
+        raise ImportCancelled()
+    progress(fase="escrita")
+
+    if modo == "append":
+        bulk_load = bulk_insert_avaliacoes(registos)
+        progress(rows_written=bulk_load["rows"])
+        return {
+            "registos_guardados": bulk_load["rows"],
+            "ja_existentes": bulk_load["existing"],
+            "linhas_ignoradas": linhas_ignoradas,
+            "sheets_processadas": list(excel_data.keys()),
+            "erros": erros,
+            "bulk_load": bulk_load,
+        }
+
+    bulk_load = upsert_avaliacoes(dedupe_natural_key(registos), ano_letivo, periodo, sheet_hashes)
+    progress(rows_written=bulk_load["inserted"] + bulk_load["updated"])
+
+    return {
+        "registos_guardados": bulk_load["inserted"] + bulk_load["updated"],
+        "inseridos": bulk_load["inserted"],
+        "atualizados": bulk_load["updated"],
+        "inalterados": bulk_load["unchanged"] + linhas_inalteradas,
+        "linhas_ignoradas": linhas_ignoradas,
+        "sheets_processadas": list(excel_data.keys()),
+        "sheets_inalteradas": sheets_inalteradas,
+        "erros": erros,
+        "bulk_load": bulk_load,
+    }
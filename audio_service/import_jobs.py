@@ -0,0 +1,229 @@
+"""
+Importações Excel em background
+O parsing (pandas/openpyxl), a transformação e a escrita na base de dados
+correm num process pool, fora do event loop do serviço de áudio
+
+As importações têm prioridade inferior às revisões dos alunos: os processos
+correm com `nice` EXCEL_IMPORT_NICE e, entre sheets, esperam (até
+EXCEL_IMPORT_MAX_PAUSE segundos) enquanto houver revisões em curso
+"""
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from model_server import shared_dict
+
+logger = logging.getLogger(__name__)
+
+IMPORT_WORKERS = int(os.getenv("EXCEL_IMPORT_WORKERS", "1"))
+# Número de jobs terminados mantidos em memória para consulta
+IMPORT_JOB_HISTORY = int(os.getenv("EXCEL_IMPORT_JOB_HISTORY", "50"))
+# Prioridade de CPU dos processos de importação (0 = igual ao serviço)
+IMPORT_NICE = int(os.getenv("EXCEL_IMPORT_NICE", "10"))
+# Pausa máxima seguida à espera que as revisões interativas terminem
+IMPORT_MAX_PAUSE = float(os.getenv("EXCEL_IMPORT_MAX_PAUSE", "30"))
+
+FINAL_STATES = ("done", "failed", "cancelled")
+# upsert: idempotente na chave natural; append: só acrescenta chaves novas
+IMPORT_MODES = ("upsert", "append")
+
+
+# Pressão interativa do worker HTTP que lançou o pool (multiprocessing.Value)
+_interactive_pressure = None
+
+
+def _init_worker(interactive_pressure):
+    global _interactive_pressure
+    _interactive_pressure = interactive_pressure
+    if IMPORT_NICE and hasattr(os, "nice"):
+        os.nice(IMPORT_NICE)
+
+
+def _run_job(job_id: str, path: str, ano_letivo: str, periodo: str, modo: str, jobs, cancel_flags) -> None:
+    """Executado no processo worker: só importa pandas/SQLAlchemy, nunca o app"""
+    from excel_import import ImportCancelled, read_workbook, run_import
+
+    logging.basicConfig(level=logging.INFO)
+
+    def update(**campos):
+        state = jobs[job_id]
+        state.update(campos)
+        jobs[job_id] = state
+
+    def should_cancel() -> bool:
+        return cancel_flags.get(job_id, False)
+
+    def throttle():
+        """Cede o CPU enquanto houver revisões interativas em curso ou em espera"""
+        if _interactive_pressure is None or not _interactive_pressure.value:
+            return
+        start = time.monotonic()
+        while _interactive_pressure.value and time.monotonic() - start < IMPORT_MAX_PAUSE:
+            time.sleep(0.05)
+        update(paused_seconds=round(jobs[job_id].get("paused_seconds", 0.0) + time.monotonic() - start, 2))
+
+    try:
+        if should_cancel():
+            raise ImportCancelled()
+        update(status="running", fase="leitura", started_at=time.time())
+        excel_data = read_workbook(path)
+        resultado = run_import(excel_data, ano_letivo, periodo, modo, progress=update, should_cancel=should_cancel, throttle=throttle)
+        update(status="done", fase="concluido", result=resultado, finished_at=time.time())
+    except ImportCancelled:
+        logger.info(f"[IMPORT] Job {job_id} cancelado")
+        update(status="cancelled", finished_at=time.time())
+    except Exception as e:
+        logger.error(f"[IMPORT] Job {job_id} falhou: {e}", exc_info=True)
+        update(status="failed", errors=jobs[job_id].get("errors", []) + [str(e)], finished_at=time.time())
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+class ImportJobManager:
+    """
+    Fila de importações: cada job corre num processo separado (spawn, para não
+    herdar o modelo Whisper nem as threads do processo principal) e publica o
+    progresso num dicionário partilhado
+    """
+
+    def __init__(self, max_workers: int = IMPORT_WORKERS, history: int = IMPORT_JOB_HISTORY):
+        self.max_workers = max_workers
+        self.history = history
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._jobs = None
+        self._cancel_flags = None
+        self._futures: Dict[str, object] = {}
+        self._listeners: List[Callable[[Dict], None]] = []
+
+    def on_complete(self, listener: Callable[[Dict], None]):
+        """Regista uma função chamada (no processo principal) quando um job termina com sucesso"""
+        self._listeners.append(listener)
+
+    def _attach(self):
+        """
+        Vários workers HTTP: liga ao estado no servidor partilhado, visível em
+        todos (também nos que nunca receberam um upload e não têm process pool)
+        """
+        if self._jobs is None:
+            jobs = shared_dict("import_jobs")
+            if jobs is not None:
+                self._jobs = jobs
+                self._cancel_flags = shared_dict("import_cancel_flags")
+
+    def _ensure_started(self):
+        if self._executor is None:
+            context = multiprocessing.get_context("spawn")
+            self._attach()
+            if self._jobs is None:
+                self._manager = context.Manager()
+                self._jobs = self._manager.dict()
+                # Separado do estado para não colidir com as atualizações do worker
+                self._cancel_flags = self._manager.dict()
+            from scheduler import cpu_scheduler
+
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(cpu_scheduler.interactive_pressure,),
+            )
+            logger.info(f"[IMPORT] Process pool iniciado ({self.max_workers} worker(s))")
+
+    def submit(self, path: str, filename: str, ano_letivo: str, periodo: str, modo: str) -> Dict:
+        self._ensure_started()
+        self._prune()
+
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = {
+            "job_id": job_id,
+            "status": "queued",
+            "fase": "fila",
+            "filename": filename,
+            "ano_letivo": ano_letivo,
+            "periodo": periodo,
+            "modo": modo,
+            "sheets_total": 0,
+            "sheets_done": 0,
+            "rows_written": 0,
+            "rows_skipped": 0,
+            "errors": [],
+            "paused_seconds": 0.0,
+            "result": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        future = self._executor.submit(_run_job, job_id, path, ano_letivo, periodo, modo, self._jobs, self._cancel_flags)
+        future.add_done_callback(lambda f, job_id=job_id, path=path: self._on_done(job_id, path, f))
+        self._futures[job_id] = future
+        logger.info(f"[IMPORT] Job {job_id} em fila ({filename}, {ano_letivo}/{periodo}, {modo})")
+        return self.get(job_id)
+
+    def _on_done(self, job_id: str, path: str, future):
+        """Notifica os listeners e trata jobs cancelados antes de arrancar ou workers que morreram"""
+        self._futures.pop(job_id, None)
+        if os.path.exists(path):
+            os.unlink(path)
+        state = self._jobs.get(job_id)
+        if state is None:
+            return
+        if state["status"] == "done":
+            for listener in self._listeners:
+                try:
+                    listener(dict(state))
+                except Exception as e:
+                    logger.error(f"[IMPORT] Erro no listener do job {job_id}: {e}")
+            return
+        if state["status"] in FINAL_STATES:
+            return
+        if future.cancelled():
+            state.update(status="cancelled", finished_at=time.time())
+        elif future.exception() is not None:
+            state.update(status="failed", errors=state["errors"] + [str(future.exception())], finished_at=time.time())
+        self._jobs[job_id] = state
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        self._attach()
+        if self._jobs is None:
+            return None
+        state = self._jobs.get(job_id)
+        if state is None:
+            return None
+        return dict(state)
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        self._attach()
+        if self._jobs is None or job_id not in self._jobs:
+            return None
+        if self._jobs[job_id]["status"] not in FINAL_STATES:
+            self._cancel_flags[job_id] = True
+            future = self._futures.get(job_id)
+            if future is not None:
+                future.cancel()
+        return self.get(job_id)
+
+    def _prune(self):
+        terminados = sorted(
+            (state["finished_at"], job_id)
+            for job_id, state in self._jobs.items()
+            if state["status"] in FINAL_STATES
+        )
+        for _, job_id in terminados[:max(0, len(terminados) - self.history)]:
+            del self._jobs[job_id]
+            self._cancel_flags.pop(job_id, None)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            if self._manager is not None:
+                self._manager.shutdown()
+            self._executor = None
+
+
+import_jobs = ImportJobManager()
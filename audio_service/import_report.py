@@ -0,0 +1,92 @@
+"""
+Relatório dos tempos de import do serviço (resumo de `python -X importtime`)
+
+Uso:
+    python app.py --import-report [--top N]
+    python import_report.py [modulo] [--top N]
+
+O módulo é importado num interpretador novo; o relatório agrupa o tempo
+por pacote de topo e indica a memória residente máxima depois do import.
+"""
+import argparse
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# "import time:       123 |        456 |   pacote.modulo" (2 espaços por nível)
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( +)(\S+)\s*$")
+
+
+def measure(module: str = "app") -> Dict:
+    """Importa `module` com -X importtime e devolve os tempos agregados"""
+    code = (
+        "import resource, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "print(time.perf_counter() - start)\n"
+        "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=Path(__file__).resolve().parent,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Import de '{module}' falhou:\n{proc.stderr[-2000:]}")
+
+    packages: Dict[str, int] = defaultdict(int)
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        packages[name.split(".")[0]] += int(self_us)
+        modules.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+
+    seconds, maxrss_kb = proc.stdout.split()[-2:]
+    return {
+        "module": module,
+        "seconds": float(seconds),
+        "max_rss_mb": round(int(maxrss_kb) / 1024, 1),
+        "packages": sorted(packages.items(), key=lambda item: item[1], reverse=True),
+        "modules": modules,
+    }
+
+
+def format_report(report: Dict, top: int = 15) -> str:
+    linhas: List[str] = [
+        f"Import de '{report['module']}': {report['seconds']:.2f}s, "
+        f"RSS máx. {report['max_rss_mb']:.1f} MB",
+        "",
+        f"{'pacote':<30} {'ms':>10}",
+    ]
+    for name, self_us in report["packages"][:top]:
+        linhas.append(f"{name:<30} {self_us / 1000:>10.1f}")
+
+    # Imports feitos diretamente pelo módulo (profundidade 1), por tempo acumulado
+    diretos = sorted(
+        (m for m in report["modules"] if m[3] == 1),
+        key=lambda m: m[2],
+        reverse=True,
+    )
+    linhas += ["", f"{'import direto':<30} {'ms (acum.)':>10}"]
+    for name, _, cumulative_us, _ in diretos[:top]:
+        linhas.append(f"{name:<30} {cumulative_us / 1000:>10.1f}")
+    return "\n".join(linhas)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Tempos de import do serviço de áudio")
+    parser.add_argument("module", nargs="?", default="app")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args(argv)
+    print(format_report(measure(args.module), args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Métricas Prometheus do serviço de áudio (GET /metrics)
+
+- audio_stage_seconds{endpoint,card_type,stage}: cada fase da revisão
+  (upload, decode, enhance, trim, export, acoustic, transcribe, g2p,
+  scoring, feedback_audio = TTS, save_review = callback ao valcoin)
+- audio_review_seconds{endpoint,card_type,outcome}: revisão completa
+  (outcome = feedback_type, ou "error" se a revisão falhou)
+- http_request_seconds{method,route,status}: todos os pedidos (rota = modelo
+  do caminho, sem ids)
+- admission_*: pedidos em curso/em fila, espera e recusas por classe
+- cpu_scheduler_*: fases em curso/em espera por prioridade e vagas de CPU
+- cache_requests_total{cache,result}: cache de respostas e de TTS
+- stt_backend_info, stt_threads: motor por tipo de cartão e threads do modelo
+
+Utilização do modelo (fração do tempo dos workers do Whisper a transcrever):
+    sum(rate(audio_stage_seconds_sum{stage="transcribe"}[1m]))
+        / max(stt_threads{setting="num_workers"})
+
+Com vários workers o arranque define PROMETHEUS_MULTIPROC_DIR: cada worker
+escreve as séries em ficheiros partilhados e /metrics agrega-as. Sem
+prometheus_client (ou METRICS_ENABLED=false) as métricas ficam desligadas e
+/metrics responde 501.
+"""
+import asyncio
+import importlib.util
+import logging
+import os
+import shutil
+import tempfile
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_AVAILABLE = importlib.util.find_spec("prometheus_client") is not None
+METRICS_ENABLED = PROMETHEUS_AVAILABLE and os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Intervalo de amostragem das filas e da utilização (segundos)
+METRICS_SAMPLE_INTERVAL = float(os.getenv("METRICS_SAMPLE_INTERVAL", "2"))
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+# Das fases rápidas (ms) ao Whisper em CPU lenta (dezenas de segundos)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0)
+REQUEST_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+if METRICS_ENABLED:
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+
+    STAGE_SECONDS = Histogram(
+        "audio_stage_seconds", "Duração de cada fase da revisão por áudio",
+        ["endpoint", "card_type", "stage"], buckets=STAGE_BUCKETS,
+    )
+    REVIEW_SECONDS = Histogram(
+        "audio_review_seconds", "Duração total da revisão por áudio",
+        ["endpoint", "card_type", "outcome"], buckets=STAGE_BUCKETS,
+    )
+    REQUEST_SECONDS = Histogram(
+        "http_request_seconds", "Duração dos pedidos HTTP",
+        ["method", "route", "status"], buckets=REQUEST_BUCKETS,
+    )
+    ADMISSION_WAIT = Histogram(
+        "admission_wait_seconds", "Espera na fila de admissão",
+        ["queue"], buckets=STAGE_BUCKETS,
+    )
+    ADMISSION_REJECTED = Counter(
+        "admission_rejected_total", "Pedidos recusados pela admissão",
+        ["queue", "reason"],
+    )
+    CACHE_REQUESTS = Counter(
+        "cache_requests_total", "Consultas às caches (hit/miss)",
+        ["cache", "result"],
+    )
+    ADMISSION_IN_FLIGHT = Gauge(
+        "admission_in_flight", "Pedidos em processamento por classe de admissão",
+        ["queue"], multiprocess_mode="livesum",
+    )
+    ADMISSION_QUEUED = Gauge(
+        "admission_queued", "Pedidos em fila por classe de admissão",
+        ["queue"], multiprocess_mode="livesum",
+    )
+    SCHEDULER_RUNNING = Gauge(
+        "cpu_scheduler_running", "Fases de CPU em curso por prioridade",
+        ["priority"], multiprocess_mode="livesum",
+    )
+    SCHEDULER_WAITING = Gauge(
+        "cpu_scheduler_waiting", "Fases de CPU à espera de vaga por prioridade",
+        ["priority"], multiprocess_mode="livesum",
+    )
+    SCHEDULER_SLOTS = Gauge(
+        "cpu_scheduler_slots", "Vagas de CPU do escalonador",
+        multiprocess_mode="livesum",
+    )
+    STT_BACKEND_INFO = Gauge(
+        "stt_backend_info", "Motor STT configurado por tipo de cartão (1 = carregado)",
+        ["card_type", "backend"], multiprocess_mode="max",
+    )
+    STT_THREADS = Gauge(
+        "stt_threads", "Configuração de threads do modelo Whisper",
+        ["setting"], multiprocess_mode="max",
+    )
+
+
+# ============================================
+# REGISTO
+# ============================================
+def observe_stage(stage: str, ctx, seconds: float):
+    """Hook do pipeline de revisão (uma observação por fase executada)"""
+    if METRICS_ENABLED:
+        STAGE_SECONDS.labels(ctx.endpoint, ctx.config.name, stage).observe(seconds)
+
+
+def observe_review(ctx, outcome: str, seconds: float):
+    if METRICS_ENABLED:
+        REVIEW_SECONDS.labels(ctx.endpoint, ctx.config.name, outcome).observe(seconds)
+
+
+def observe_request(method: str, route: str, status: int, seconds: float):
+    if METRICS_ENABLED:
+        REQUEST_SECONDS.labels(method, route, str(status)).observe(seconds)
+
+
+def observe_admission_wait(queue: str, seconds: float):
+    if METRICS_ENABLED:
+        ADMISSION_WAIT.labels(queue).observe(seconds)
+
+
+def admission_rejected(queue: str, status_code: int):
+    if METRICS_ENABLED:
+        ADMISSION_REJECTED.labels(queue, "timeout" if status_code == 503 else "queue_full").inc()
+
+
+def cache_request(cache: str, hit: bool):
+    if METRICS_ENABLED:
+        CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+# ============================================
+# AMOSTRAGEM (filas, escalonador, modelo)
+# ============================================
+def sample(stt_card_types=()):
+    """Atualiza os gauges com o estado atual deste worker"""
+    if not METRICS_ENABLED:
+        return
+    import admission
+    import stt_backends
+    from model_server import SERVICE_WORKERS, WHISPER_NUM_WORKERS, whisper_cpu_threads
+    from scheduler import cpu_scheduler
+
+    for name, controller in admission.admission.items():
+        ADMISSION_IN_FLIGHT.labels(name).set(controller.in_flight)
+        ADMISSION_QUEUED.labels(name).set(controller.queued)
+
+    stats = cpu_scheduler.stats()
+    SCHEDULER_SLOTS.set(stats["slots"])
+    for name, values in stats["classes"].items():
+        SCHEDULER_RUNNING.labels(name).set(values["running"])
+        SCHEDULER_WAITING.labels(name).set(values["waiting"])
+
+    for card_type in stt_card_types:
+        try:
+            spec = stt_backends.backend_spec(card_type)
+        except ValueError:
+            continue
+        STT_BACKEND_INFO.labels(card_type, spec).set(int(stt_backends.for_card_type(card_type) is not None))
+    STT_THREADS.labels("cpu_threads").set(whisper_cpu_threads())
+    STT_THREADS.labels("num_workers").set(WHISPER_NUM_WORKERS)
+    STT_THREADS.labels("service_workers").set(SERVICE_WORKERS)
+
+
+async def sampler(stt_card_types=()):
+    """Tarefa do lifespan: amostra os gauges a cada METRICS_SAMPLE_INTERVAL"""
+    while True:
+        try:
+            sample(stt_card_types)
+        except Exception as e:
+            logger.warning(f"[METRICS] Erro na amostragem: {e}")
+        await asyncio.sleep(METRICS_SAMPLE_INTERVAL)
+
+
+# ============================================
+# EXPOSIÇÃO E MODO MULTIPROCESSO
+# ============================================
+def prepare_multiprocess():
+    """
+    Chamado no arranque antes de lançar vários workers: pasta partilhada
+    (limpa) para as séries de cada worker
+    """
+    if not METRICS_ENABLED:
+        return
+    path = os.environ.get(MULTIPROC_DIR_ENV)
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+    else:
+        path = tempfile.mkdtemp(prefix="prometheus-")
+        os.environ[MULTIPROC_DIR_ENV] = path
+    logger.info(f"[METRICS] Modo multiprocesso: {path}")
+
+
+def mark_worker_dead():
+    """Shutdown do worker: retira os gauges "live" deste processo"""
+    if METRICS_ENABLED and os.environ.get(MULTIPROC_DIR_ENV):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def render() -> Tuple[bytes, str]:
+    """Texto de exposição Prometheus (agregado entre workers, se for o caso)"""
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
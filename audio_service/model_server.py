@@ -0,0 +1,245 @@
+"""
+Serviço multi-processo com o modelo Whisper partilhado
+
+Com AUDIO_SERVICE_WORKERS > 1 o arranque (`python app.py`) lança:
+- um processo servidor (multiprocessing.managers, socket Unix local) que
+  carrega o modelo Whisper uma única vez e transcreve em paralelo
+  (uma thread por ligação, `num_workers` do CTranslate2)
+- N workers uvicorn que enviam o caminho do áudio ao servidor
+
+O mesmo servidor guarda o estado que tem de ser comum aos workers: jobs de
+importação Excel e contadores de geração da cache de respostas.
+"""
+import dataclasses
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from multiprocessing.managers import BaseManager, DictProxy
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cpu_config
+
+logger = logging.getLogger(__name__)
+
+SERVICE_WORKERS = max(1, int(os.getenv("AUDIO_SERVICE_WORKERS", "1")))
+# Transcrições em paralelo no CTranslate2 (por omissão, uma por worker HTTP)
+WHISPER_NUM_WORKERS = max(1, int(os.getenv("WHISPER_NUM_WORKERS", str(SERVICE_WORKERS))))
+# Threads por transcrição (vazio = calculado a partir dos cores disponíveis)
+WHISPER_CPU_THREADS = os.getenv("WHISPER_CPU_THREADS", "")
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "small")
+WHISPER_DOWNLOAD_ROOT = os.getenv("WHISPER_DOWNLOAD_ROOT", "/root/.cache/whisper")
+
+# Endereço do servidor, definido pelo arranque para os workers uvicorn
+MANAGER_ADDRESS_ENV = "AUDIO_SERVICE_MANAGER"
+
+
+def whisper_cpu_threads(num_workers: int = WHISPER_NUM_WORKERS) -> int:
+    """
+    Threads por transcrição: os cores deste processo (afinidade incluída)
+    divididos pelas transcrições em paralelo; num só processo fica no
+    valor por omissão do CTranslate2 (4), limitado aos cores disponíveis
+    """
+    if WHISPER_CPU_THREADS:
+        return int(WHISPER_CPU_THREADS)
+    cpus = cpu_config.available_cpus()
+    if SERVICE_WORKERS == 1 and num_workers == 1:
+        return min(4, cpus)
+    return max(1, cpus // num_workers)
+
+
+def create_whisper_model(
+    cpu_threads: Optional[int] = None,
+    num_workers: int = WHISPER_NUM_WORKERS,
+    model_size: str = WHISPER_MODEL_SIZE,
+):
+    """WhisperModel com a divisão de threads configurada"""
+    import ctranslate2
+    from faster_whisper import WhisperModel
+
+    # GPU detetada pelo CTranslate2 (backend do faster-whisper): evita importar torch
+    cuda = ctranslate2.get_cuda_device_count() > 0
+    return WhisperModel(
+        model_size,  # small = bom equilíbrio velocidade/precisão
+        download_root=WHISPER_DOWNLOAD_ROOT,
+        device="cuda" if cuda else "cpu",
+        compute_type="float16" if cuda else "int8",
+        cpu_threads=cpu_threads if cpu_threads is not None else whisper_cpu_threads(num_workers),
+        num_workers=num_workers,
+    )
+
+
+def _plain(value):
+    """Segment/Word/TranscriptionInfo (dataclass ou NamedTuple) -> dict"""
+    if dataclasses.is_dataclass(value):
+        return dataclasses.asdict(value)
+    if hasattr(value, "_asdict"):
+        return {k: _plain(v) for k, v in value._asdict().items()}
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    return value
+
+
+# ============================================
+# PROCESSO SERVIDOR
+# ============================================
+class WhisperService:
+    """Modelo carregado uma vez; cada ligação de cliente corre na sua thread"""
+
+    def __init__(self):
+        self._model = None
+        self._lock = threading.Lock()
+        self._info: Dict = {}
+
+    def load(self) -> Dict:
+        with self._lock:
+            if self._model is None:
+                start = time.perf_counter()
+                self._model = create_whisper_model()
+                self._info = {
+                    "model": WHISPER_MODEL_SIZE,
+                    "cpu_threads": whisper_cpu_threads(),
+                    "num_workers": WHISPER_NUM_WORKERS,
+                    "load_seconds": round(time.perf_counter() - start, 2),
+                    "pid": os.getpid(),
+                }
+                logger.info(f"[MODEL] Whisper carregado no servidor: {self._info}")
+        return self._info
+
+    def transcribe(self, path: str, options: Dict) -> Tuple[List[Dict], Dict]:
+        self.load()
+        segments, info = self._model.transcribe(path, **options)
+        return [_plain(segment) for segment in segments], {
+            "language": info.language,
+            "language_probability": info.language_probability,
+            "duration": info.duration,
+        }
+
+
+class SharedCounters:
+    """
+    Contadores incrementados no processo servidor: um read-modify-write num
+    dicionário partilhado perde incrementos quando dois workers o fazem ao mesmo tempo
+    """
+
+    def __init__(self):
+        self._values: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> int:
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def incr(self, keys: List[str]) -> List[int]:
+        with self._lock:
+            for key in keys:
+                self._values[key] = self._values.get(key, 0) + 1
+            return [self._values[key] for key in keys]
+
+
+_whisper_service: Optional[WhisperService] = None
+_shared_dicts: Dict[str, dict] = {}
+_shared_counters: Dict[str, SharedCounters] = {}
+
+
+def _get_whisper_service() -> WhisperService:
+    global _whisper_service
+    if _whisper_service is None:
+        _whisper_service = WhisperService()
+    return _whisper_service
+
+
+def _get_shared_dict(name: str) -> dict:
+    return _shared_dicts.setdefault(name, {})
+
+
+def _get_shared_counters(name: str) -> SharedCounters:
+    return _shared_counters.setdefault(name, SharedCounters())
+
+
+class AudioServiceManager(BaseManager):
+    pass
+
+
+AudioServiceManager.register("whisper", callable=_get_whisper_service)
+AudioServiceManager.register("shared_dict", callable=_get_shared_dict, proxytype=DictProxy)
+AudioServiceManager.register("shared_counters", callable=_get_shared_counters)
+
+
+def _init_server_process():
+    logging.basicConfig(level=logging.INFO)
+    cpu_config.apply_affinity(cpu_config.WHISPER_CPU_AFFINITY, "servidor do modelo")
+
+
+def start_server() -> AudioServiceManager:
+    """
+    Lança o processo servidor (antes dos workers) e publica o endereço no
+    environment; os workers herdam o authkey do processo de arranque
+    """
+    address = os.path.join(tempfile.mkdtemp(prefix="audio_service_"), "manager.sock")
+    manager = AudioServiceManager(address=address, ctx=multiprocessing.get_context("spawn"))
+    manager.start(initializer=_init_server_process)
+    os.environ[MANAGER_ADDRESS_ENV] = address
+    logger.info(f"[MODEL] Servidor do modelo em {address}")
+    return manager
+
+
+# ============================================
+# CLIENTE (WORKERS)
+# ============================================
+_manager: Optional[AudioServiceManager] = None
+
+
+def connect() -> Optional[AudioServiceManager]:
+    """Ligação ao servidor do processo de arranque (None em modo de processo único)"""
+    global _manager
+    address = os.getenv(MANAGER_ADDRESS_ENV)
+    if not address:
+        return None
+    if _manager is None:
+        manager = AudioServiceManager(address=address)
+        manager.connect()
+        _manager = manager
+    return _manager
+
+
+def shared_dict(name: str):
+    """Dicionário partilhado por todos os workers (None em modo de processo único)"""
+    manager = connect()
+    return manager.shared_dict(name) if manager is not None else None
+
+
+def shared_counters(name: str):
+    """Contadores partilhados por todos os workers (None em modo de processo único)"""
+    manager = connect()
+    return manager.shared_counters(name) if manager is not None else None
+
+
+class RemoteWhisperModel:
+    """
+    Mesma interface que WhisperModel.transcribe, executada no servidor
+    Os segmentos são devolvidos como iterador (tal como o gerador do
+    faster-whisper) com atributos em vez de dataclasses
+    """
+
+    def __init__(self, manager: AudioServiceManager):
+        self._manager = manager
+        self._local = threading.local()
+        self.info = self._service().load()
+
+    def _service(self):
+        # Um proxy (e uma ligação) por thread
+        if not hasattr(self._local, "service"):
+            self._local.service = self._manager.whisper()
+        return self._local.service
+
+    def transcribe(self, path: str, **options) -> Tuple[Iterator, SimpleNamespace]:
+        segments, info = self._service().transcribe(path, options)
+        result = []
+        for segment in segments:
+            words = [SimpleNamespace(**word) for word in segment.pop("words", None) or []]
+            result.append(SimpleNamespace(words=words, **segment))
+        return iter(result), SimpleNamespace(**info)
@@ -0,0 +1,202 @@
+"""
+Profiler de amostragem e snapshots de alocações para diagnóstico em produção
+
+CPU: uma thread lê as stacks de todas as threads do worker
+(`sys._current_frames`) a cada `interval` -- o event loop e as threads do
+escalonador de CPU, onde correm descodificação, librosa, Whisper local,
+SequenceMatcher... Não instrumenta chamadas (custo ~ proporcional ao número
+de threads por amostra) e exporta:
+- collapsed   "thread;frame;...;frame contagem" (flamegraph.pl, speedscope, inferno)
+- speedscope  JSON do speedscope.app (um perfil por thread)
+
+Alocações: tracemalloc ativo durante a janela; devolve o top-N por linha
+(ou traceback) do que foi alocado e continua vivo, e o crescimento entre o
+início e o fim da janela.
+
+Um perfil de cada vez por worker; com vários workers cada pedido perfila o
+worker que o recebe (o Whisper partilhado corre no servidor do modelo).
+"""
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Sem token o profiler fica desativado (Authorization: Bearer <PROFILER_TOKEN>)
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN", "")
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "10"))
+PROFILER_TRACEMALLOC_FRAMES = int(os.getenv("PROFILER_TRACEMALLOC_FRAMES", "10"))
+PROFILE_FORMATS = ("collapsed", "speedscope")
+
+# Folhas de threads à espera (executor ocioso, select do event loop sem trabalho)
+IDLE_FRAMES = {
+    ("wait", "threading.py"),
+    ("get", "queue.py"),
+    ("_worker", "thread.py"),
+    ("select", "selectors.py"),
+    ("_wait_for_tstate_lock", "threading.py"),
+}
+
+Frame = Tuple[str, str, int]  # (função, ficheiro, primeira linha)
+
+_busy = threading.Lock()
+_path_prefixes = sorted({os.path.abspath(p) for p in sys.path if p}, key=len, reverse=True)
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _short_path(path: str) -> str:
+    for prefix in _path_prefixes:
+        if path.startswith(prefix + os.sep):
+            return path[len(prefix) + 1:]
+    return path
+
+
+@contextmanager
+def _exclusive():
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy("Já está a decorrer um perfil neste worker")
+    try:
+        yield
+    finally:
+        _busy.release()
+
+
+# ============================================
+# CPU (AMOSTRAGEM DE STACKS)
+# ============================================
+@dataclass
+class CPUProfile:
+    seconds: float
+    interval: float
+    ticks: int = 0
+    # (thread, stack da raiz para a folha) -> amostras
+    stacks: Counter = field(default_factory=Counter)
+
+    @staticmethod
+    def frame_name(frame: Frame) -> str:
+        name, path, line = frame
+        return f"{name} ({path}:{line})"
+
+    def collapsed(self) -> str:
+        lines = [
+            ";".join([thread] + [self.frame_name(frame) for frame in stack]) + f" {count}"
+            for (thread, stack), count in self.stacks.most_common()
+        ]
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self) -> Dict:
+        frames: List[Dict] = []
+        index: Dict[Frame, int] = {}
+        profiles: Dict[str, Dict] = {}
+        for (thread, stack), count in self.stacks.items():
+            ids = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                ids.append(index[frame])
+            profile = profiles.setdefault(thread, {
+                "type": "sampled", "name": thread, "unit": "seconds",
+                "startValue": 0, "endValue": 0, "samples": [], "weights": [],
+            })
+            profile["samples"].append(ids)
+            profile["weights"].append(count * self.interval)
+            profile["endValue"] += count * self.interval
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"audio_service pid {os.getpid()} ({self.seconds:g}s, {self.ticks} amostras)",
+            "exporter": "audio_service profiler",
+            "shared": {"frames": frames},
+            "profiles": sorted(profiles.values(), key=lambda p: -p["endValue"]),
+        }
+
+
+def sample(seconds: float, interval: float = PROFILER_INTERVAL_MS / 1000, include_idle: bool = False) -> CPUProfile:
+    """Amostra as stacks de todas as threads do processo durante `seconds` (bloqueia)"""
+    with _exclusive():
+        own = threading.get_ident()
+        profile = CPUProfile(seconds, interval)
+        logger.info(f"[PROFILER] CPU: {seconds:g}s a cada {interval * 1000:g} ms")
+        deadline = time.monotonic() + seconds
+        next_tick = time.monotonic()
+        while next_tick < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, _short_path(code.co_filename), code.co_firstlineno))
+                    frame = frame.f_back
+                if not include_idle and (stack[0][0], os.path.basename(stack[0][1])) in IDLE_FRAMES:
+                    continue
+                stack.reverse()
+                profile.stacks[(names.get(ident, f"thread-{ident}"), tuple(stack))] += 1
+            profile.ticks += 1
+            next_tick += interval
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+        logger.info(f"[PROFILER] CPU: {profile.ticks} amostras, {len(profile.stacks)} stacks distintas")
+        return profile
+
+
+# ============================================
+# ALOCAÇÕES (TRACEMALLOC)
+# ============================================
+def _stat(stat, traceback: bool) -> Dict:
+    entry = {
+        # Local da alocação = frame mais recente (o traceback vai do mais antigo para o mais recente)
+        "location": f"{_short_path(stat.traceback[-1].filename)}:{stat.traceback[-1].lineno}",
+        "size_kb": round(stat.size / 1024, 1),
+        "count": stat.count,
+    }
+    if hasattr(stat, "size_diff"):
+        entry["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+        entry["count_diff"] = stat.count_diff
+    if traceback:
+        entry["traceback"] = [f"{_short_path(frame.filename)}:{frame.lineno}" for frame in stat.traceback]
+    return entry
+
+
+def allocations(seconds: float, top: int = 25, traceback: bool = False) -> Dict:
+    """
+    Ativa o tracemalloc durante `seconds` (se ainda não estiver ativo) e
+    devolve o top-N das alocações vivas e do crescimento na janela (bloqueia)
+    """
+    with _exclusive():
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(PROFILER_TRACEMALLOC_FRAMES)
+        logger.info(f"[PROFILER] Alocações: {seconds:g}s (top {top})")
+        try:
+            before = tracemalloc.take_snapshot()
+            time.sleep(seconds)
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if started:
+                tracemalloc.stop()
+
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        before, after = before.filter_traces(filters), after.filter_traces(filters)
+        group_by = "traceback" if traceback else "lineno"
+        return {
+            "seconds": seconds,
+            "pid": os.getpid(),
+            "tracing_started_for_window": started,
+            "traced_current_mb": round(current / 1024 / 1024, 2),
+            "traced_peak_mb": round(peak / 1024 / 1024, 2),
+            "top": [_stat(stat, traceback) for stat in after.statistics(group_by)[:top]],
+            "growth": [_stat(stat, traceback) for stat in after.compare_to(before, group_by)[:top]],
+        }
@@ -0,0 +1,147 @@
+"""
+Cache de respostas das consultas analíticas (/api/avaliacoes*)
+As entradas ficam em memória e são invalidadas por um contador de geração
+por (ano_letivo, periodo), incrementado pela importação Excel.
+Com REDIS_URL definido os contadores são partilhados entre processos/réplicas;
+sem Redis, os workers da mesma instância partilham-nos via model_server.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from model_server import SharedCounters, shared_counters
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+REDIS_URL = os.getenv("REDIS_URL")
+
+_GLOBAL = "*"
+
+
+class CacheEntry:
+    __slots__ = ("body", "etag", "headers", "generation")
+
+    def __init__(self, body: bytes, headers: Dict[str, str], generation: Tuple[int, ...]):
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.headers = headers
+        self.generation = generation
+
+
+class GenerationCounter:
+    """Contadores por fatia (ano_letivo, periodo) e um contador global"""
+
+    def __init__(self, redis_url: Optional[str] = None):
+        self._local = None
+        self._redis = None
+        if redis_url:
+            try:
+                import redis
+                self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.5)
+                self._redis.ping()
+                logger.info("[CACHE] Contadores de geração partilhados via Redis")
+            except Exception as e:
+                logger.warning(f"[CACHE] Redis indisponível, a usar contadores locais: {e}")
+                self._redis = None
+
+    def _counters(self):
+        """
+        Contadores locais ou, com vários workers, os do servidor partilhado
+        (o incremento corre no servidor, atómico entre workers)
+        """
+        if self._local is None:
+            shared = shared_counters("cache_generations")
+            self._local = shared if shared is not None else SharedCounters()
+        return self._local
+
+    @staticmethod
+    def _key(ano_letivo: Optional[str], periodo: Optional[str]) -> str:
+        if ano_letivo and periodo:
+            return f"{ano_letivo}|{periodo}"
+        return _GLOBAL
+
+    def get(self, ano_letivo: Optional[str], periodo: Optional[str]) -> Tuple[int, ...]:
+        """
+        Geração de que depende uma consulta: a da fatia quando o pedido
+        filtra por ano letivo e período, caso contrário a global
+        """
+        key = self._key(ano_letivo, periodo)
+        if self._redis is not None:
+            try:
+                value = self._redis.get(f"audio_service:geracao:{key}")
+                return (int(value or 0),)
+            except Exception as e:
+                logger.warning(f"[CACHE] Erro no Redis: {e}")
+        return (self._counters().get(key),)
+
+    def bump(self, ano_letivo: str, periodo: str):
+        keys = (self._key(ano_letivo, periodo), _GLOBAL)
+        if self._redis is not None:
+            try:
+                pipe = self._redis.pipeline()
+                for key in keys:
+                    pipe.incr(f"audio_service:geracao:{key}")
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"[CACHE] Erro no Redis: {e}")
+        self._counters().incr(list(keys))
+
+
+class ResponseCache:
+    """LRU em memória com validação por geração e ETag"""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, redis_url: Optional[str] = REDIS_URL):
+        self.max_entries = max_entries
+        self.generations = GenerationCounter(redis_url)
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(endpoint: str, params: Dict) -> str:
+        """Chave normalizada: parâmetros vazios ignorados e ordem irrelevante"""
+        normalized = {k: v for k, v in params.items() if v not in (None, "")}
+        return endpoint + "?" + json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+
+    def get(self, key: str, generation: Tuple[int, ...]) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.generation != generation:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, body: bytes, headers: Dict[str, str], generation: Tuple[int, ...]) -> CacheEntry:
+        entry = CacheEntry(body, headers, generation)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, ano_letivo: str, periodo: str):
+        """Chamado quando uma importação escreve dados para a fatia"""
+        self.generations.bump(ano_letivo, periodo)
+        logger.info(f"[CACHE] Geração incrementada para {ano_letivo}/{periodo}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+response_cache = ResponseCache()
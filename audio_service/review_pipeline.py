@@ -0,0 +1,395 @@
+"""
+Pipeline de revisão por áudio (fonema, spelling, audio, streaming, avaliação em lote)
+
+Uma revisão é uma sequência de fases sobre um `ReviewContext`:
+
+    [upload ->] decode -> enhance -> trim -> export -> acoustic -> transcribe
+    -> g2p -> scoring [-> feedback_audio -> save_review]
+
+(as fases entre parênteses retos têm efeitos secundários e são
+acrescentadas pelo app).
+
+Cada fase declara os campos do contexto que lê (`requires`) e os que
+escreve (`provides`); o pipeline valida a ordem ao ser construído e as
+entradas antes de cada fase. As diferenças entre tipos de cartão ficam
+na `CardTypeConfig` (verificação acústica, opções do Whisper, normalização,
+regras de rating, mensagens), não em cópias do endpoint.
+
+Uma fase pode terminar a revisão mais cedo (`ctx.finish`, ex. sem voz):
+as fases seguintes são saltadas, exceto as marcadas `always` (feedback e
+registo da revisão). Os tempos de cada fase ficam em `ctx.timings` e são
+passados aos hooks do pipeline.
+"""
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pydub import AudioSegment
+
+import speech_analysis as sa
+from streaming import WHISPER_SAMPLE_RATE
+from stt_backends import STTBackend, Word
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineError(RuntimeError):
+    """Pipeline mal construído ou fase sem as entradas de que precisa"""
+
+
+# ============================================
+# CONFIGURAÇÃO POR TIPO DE CARTÃO
+# ============================================
+@dataclass(frozen=True)
+class CardTypeConfig:
+    name: str
+    default_threshold: float
+    # (análise, texto esperado, limiar) -> (is_correct, rating, mensagem, feedback_type)
+    rate: Callable[[Dict, str, float], Tuple[bool, int, str, str]]
+    # Análise acústica e resposta "no_audio" quando não há voz
+    acoustic_check: bool = True
+    # Transcrição vazia termina a revisão com "stt_failed"
+    require_transcription: bool = True
+    word_timestamps: bool = True
+    use_phonetic: bool = True
+    # Transformação da transcrição antes da comparação (ex. soletração)
+    normalize: Optional[Callable[[str], str]] = None
+    # Mensagem de feedback em áudio (TTS); sem ela a resposta traz só "feedback"
+    feedback_audio: bool = True
+    messages: Dict[str, str] = field(default_factory=dict)
+
+
+def _rate_spelling(analysis: Dict, expected_text: str, threshold: float):
+    feedback_msg, feedback_type = sa.spelling_feedback(analysis)
+    is_correct = analysis["composite_score"] >= threshold
+    return is_correct, sa.get_rating_from_analysis(analysis), feedback_msg, feedback_type
+
+
+def _rate_audio(analysis: Dict, expected_text: str, threshold: float):
+    rating = sa.get_rating_from_analysis(analysis)
+    is_correct = analysis["composite_score"] >= threshold
+    return is_correct, rating, sa.get_feedback_message(rating, analysis), "correct" if is_correct else "incorrect"
+
+
+CARD_TYPE_CONFIGS: Dict[str, CardTypeConfig] = {
+    "fonema": CardTypeConfig(
+        name="fonema",
+        default_threshold=60.0,
+        rate=sa.rate_phoneme_attempt,
+        messages={
+            "no_audio": "Não consigo ouvir nada. Fala mais perto do microfone!",
+            "stt_failed": "Não consegui entender. Tenta falar mais devagar!",
+        },
+    ),
+    "spelling": CardTypeConfig(
+        name="spelling",
+        default_threshold=75.0,
+        normalize=sa.normalize_spelling,
+        rate=_rate_spelling,
+        messages={
+            "no_audio": "Não consigo ouvir. Fala mais alto!",
+            "stt_failed": "Não consegui entender. Soletra mais devagar!",
+        },
+    ),
+    # Frases completas: sem verificação acústica nem fonética, feedback só em texto
+    "audio": CardTypeConfig(
+        name="audio",
+        default_threshold=75.0,
+        acoustic_check=False,
+        require_transcription=False,
+        word_timestamps=False,
+        use_phonetic=False,
+        rate=_rate_audio,
+        feedback_audio=False,
+    ),
+}
+
+
+# ============================================
+# CONTEXTO DE UMA REVISÃO
+# ============================================
+@dataclass
+class ReviewContext:
+    config: CardTypeConfig
+    expected_text: str
+    threshold: float
+    language: str = "pt"
+    # Entrada: ficheiro enviado (upload/lote) ou amostras 16 kHz já cortadas (streaming)
+    source_path: Optional[str] = None
+    samples: Optional[np.ndarray] = None
+    # Motor de transcrição do tipo de cartão (None = STT indisponível)
+    stt: Optional[STTBackend] = None
+    # Prefixo dos logs ([FONEMA], [STREAM], ...)
+    tag: str = ""
+    # Dados dos efeitos secundários (registo da revisão), usados pelas fases do app
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    audio_segment: Optional[AudioSegment] = None
+    wav_path: Optional[str] = None
+    acoustic_info: Optional[Dict] = None
+    transcription: Optional[str] = None
+    words: List[Word] = field(default_factory=list)
+    confidence: float = 0.0
+    normalized_transcription: Optional[str] = None
+    phonetic_analysis: Optional[Dict] = None
+    analysis: Optional[Dict] = None
+    is_correct: Optional[bool] = None
+    rating: Optional[int] = None
+    feedback_type: Optional[str] = None
+    feedback_message: Optional[str] = None
+    feedback_audio_url: Optional[str] = None
+
+    finished: bool = False
+    timings: Dict[str, float] = field(default_factory=dict)
+    temp_files: List[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        self.tag = self.tag or self.config.name.upper()
+
+    @property
+    def endpoint(self) -> str:
+        """Origem da revisão (fonema, spelling, audio, stream, eval...), para métricas"""
+        return self.tag.lower()
+
+    def finish(self, feedback_type: str):
+        """Termina a revisão sem avaliação (rating 1), com a mensagem do tipo de cartão"""
+        self.is_correct = False
+        self.rating = 1
+        self.feedback_type = feedback_type
+        self.feedback_message = self.config.messages.get(feedback_type, "")
+        self.transcription = self.transcription or ""
+        self.confidence = 0.0
+        self.finished = True
+
+    def cleanup(self):
+        for path in self.temp_files:
+            if os.path.exists(path):
+                os.unlink(path)
+        self.temp_files.clear()
+
+    def response(self) -> Dict:
+        """Corpo da resposta dos endpoints de revisão"""
+        result = {
+            "transcription": self.transcription or "",
+            "is_correct": bool(self.is_correct),
+            "similarity_score": self.analysis["content_similarity"] if self.analysis else 0.0,
+            "composite_score": self.analysis["composite_score"] if self.analysis else 0.0,
+            "confidence_score": self.confidence,
+            "expected_text": self.expected_text,
+            "rating": self.rating,
+        }
+        if self.normalized_transcription is not None:
+            result["normalized_transcription"] = self.normalized_transcription
+        if self.analysis is not None:
+            result["detailed_analysis"] = self.analysis
+        if self.config.feedback_audio:
+            result["feedback_type"] = self.feedback_type
+            result["feedback_message"] = self.feedback_message
+            result["feedback_audio_url"] = self.feedback_audio_url
+        else:
+            result["feedback"] = self.feedback_message
+        if self.acoustic_info is not None:
+            result["acoustic_analysis"] = self.acoustic_info
+        return result
+
+
+# ============================================
+# FASES
+# ============================================
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    fn: Callable[[ReviewContext], Any]
+    requires: Tuple[str, ...] = ()
+    provides: Tuple[str, ...] = ()
+    # Condição para correr (ex. só para uploads); None = corre sempre
+    when: Optional[Callable[[ReviewContext], bool]] = None
+    # Corre mesmo depois de `ctx.finish` (feedback, registo da revisão)
+    always: bool = False
+    # Fase rápida: corre no event loop em vez de pedir uma vaga de CPU
+    inline: bool = False
+
+    def should_run(self, ctx: ReviewContext) -> bool:
+        if ctx.finished and not self.always:
+            return False
+        return self.when is None or self.when(ctx)
+
+
+def _decode(ctx: ReviewContext):
+    ctx.audio_segment = AudioSegment.from_file(ctx.source_path)
+    logger.info(f"[{ctx.tag}] 📊 Original: {ctx.audio_segment.dBFS:.1f}dB, {len(ctx.audio_segment)}ms")
+
+
+def _enhance(ctx: ReviewContext):
+    ctx.audio_segment = sa.enhance_audio_for_speech_recognition(ctx.audio_segment)
+
+
+def _trim(ctx: ReviewContext):
+    ctx.audio_segment = sa.trim_to_speech(ctx.audio_segment)
+
+
+def _export(ctx: ReviewContext):
+    fd, ctx.wav_path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    ctx.temp_files.append(ctx.wav_path)
+    if ctx.audio_segment is not None:
+        ctx.audio_segment.export(ctx.wav_path, format="wav")
+    else:
+        pcm = (np.clip(ctx.samples, -1.0, 1.0) * 32767).astype("<i2")
+        AudioSegment(pcm.tobytes(), frame_rate=WHISPER_SAMPLE_RATE, sample_width=2, channels=1).export(ctx.wav_path, format="wav")
+
+
+def _acoustic(ctx: ReviewContext):
+    ctx.acoustic_info = sa.analyze_audio_quality(ctx.wav_path)
+    if not ctx.acoustic_info.get("quality_ok", False):
+        logger.warning(f"[{ctx.tag}] ⚠️ Qualidade baixa: {ctx.acoustic_info}")
+    if not ctx.acoustic_info.get("has_voice", False):
+        ctx.finish("no_audio")
+
+
+def _transcribe(ctx: ReviewContext):
+    # Streaming: as amostras em memória evitam descodificar o WAV outra vez
+    audio = ctx.samples if ctx.samples is not None else ctx.wav_path
+    transcript = ctx.stt.transcribe(
+        audio, ctx.language, hint=ctx.expected_text, word_timestamps=ctx.config.word_timestamps
+    )
+    ctx.transcription = transcript.text
+    ctx.words = transcript.words
+    ctx.confidence = transcript.confidence if transcript.words else 0.5
+    logger.debug(f"[{ctx.tag}] {ctx.stt.name}: '{ctx.transcription}' (conf: {ctx.confidence:.2f})")
+
+
+def _check_transcription(ctx: ReviewContext):
+    if not ctx.transcription:
+        ctx.transcription = ""
+        ctx.confidence = 0.0
+        if ctx.config.require_transcription:
+            logger.warning(f"[{ctx.tag}] ❌ STT falhou")
+            ctx.finish("stt_failed")
+
+
+def _scoring_text(ctx: ReviewContext) -> str:
+    """Transcrição a comparar com o texto esperado (normalizada pelo tipo de cartão)"""
+    if ctx.config.normalize is None:
+        return ctx.transcription
+    if ctx.normalized_transcription is None:
+        ctx.normalized_transcription = ctx.config.normalize(ctx.transcription)
+    return ctx.normalized_transcription
+
+
+def _g2p(ctx: ReviewContext):
+    ctx.phonetic_analysis = sa.compare_phonemes(_scoring_text(ctx), ctx.expected_text)
+
+
+def _score(ctx: ReviewContext):
+    ctx.analysis = sa.analyze_text_quality(
+        _scoring_text(ctx), ctx.expected_text,
+        use_phonetic=ctx.config.use_phonetic, phonetic_analysis=ctx.phonetic_analysis
+    )
+    ctx.is_correct, ctx.rating, ctx.feedback_message, ctx.feedback_type = ctx.config.rate(
+        ctx.analysis, ctx.expected_text, ctx.threshold
+    )
+    logger.info(f"[{ctx.tag}] ✅ Rating={ctx.rating}, Feedback='{ctx.feedback_message}'")
+
+
+CORE_STAGES: List[Stage] = [
+    Stage("decode", _decode, requires=("source_path",), provides=("audio_segment",),
+          when=lambda ctx: ctx.samples is None),
+    Stage("enhance", _enhance, requires=("audio_segment",), provides=("audio_segment",),
+          when=lambda ctx: ctx.samples is None),
+    Stage("trim", _trim, requires=("audio_segment",), provides=("audio_segment",),
+          when=lambda ctx: ctx.samples is None),
+    Stage("export", _export, provides=("wav_path",)),
+    Stage("acoustic", _acoustic, requires=("wav_path",), provides=("acoustic_info",),
+          when=lambda ctx: ctx.config.acoustic_check),
+    Stage("transcribe", _transcribe, requires=("wav_path",), provides=("transcription",),
+          when=lambda ctx: ctx.stt is not None),
+    Stage("check_transcription", _check_transcription, provides=("transcription",), inline=True),
+    Stage("g2p", _g2p, requires=("transcription",), provides=("phonetic_analysis",),
+          when=lambda ctx: ctx.config.use_phonetic and sa.G2P_AVAILABLE and bool(ctx.transcription)),
+    Stage("scoring", _score, requires=("transcription",), provides=("analysis", "rating", "feedback_message")),
+]
+
+# Campos preenchidos por quem cria o contexto
+CONTEXT_INPUTS = ("config", "expected_text", "threshold", "language", "source_path", "samples", "stt", "extra")
+
+
+# ============================================
+# MOTOR
+# ============================================
+StageHook = Callable[[str, ReviewContext, float], None]
+
+
+class ReviewPipeline:
+    """Sequência de fases com validação de entradas/saídas e hooks de tempo"""
+
+    def __init__(self, stages: Sequence[Stage], hooks: Sequence[StageHook] = ()):
+        self.stages = list(stages)
+        self.hooks: List[StageHook] = list(hooks)
+        self._validate()
+
+    def _validate(self):
+        available = set(CONTEXT_INPUTS)
+        names = set()
+        for stage in self.stages:
+            if stage.name in names:
+                raise PipelineError(f"Fase repetida: {stage.name}")
+            names.add(stage.name)
+            missing = [name for name in stage.requires if name not in available]
+            if missing:
+                raise PipelineError(f"Fase '{stage.name}' precisa de {missing}, não produzidos antes")
+            available.update(stage.provides)
+
+    def _check_inputs(self, stage: Stage, ctx: ReviewContext):
+        missing = [name for name in stage.requires if getattr(ctx, name) is None]
+        if missing:
+            raise PipelineError(f"Fase '{stage.name}' sem entradas: {missing}")
+
+    def _record(self, stage: Stage, ctx: ReviewContext, seconds: float):
+        ctx.timings[stage.name] = round(seconds * 1000, 1)
+        for hook in self.hooks:
+            try:
+                hook(stage.name, ctx, seconds)
+            except Exception as e:
+                logger.warning(f"[PIPELINE] Hook falhou na fase {stage.name}: {e}")
+
+    async def run(self, ctx: ReviewContext, offload: Callable[..., Awaitable]) -> ReviewContext:
+        """
+        Executa as fases no event loop. `offload(fn, ctx)` corre as fases
+        pesadas fora do loop (no app: escalonador de CPU, classe interativa);
+        fases assíncronas (ex. registo da revisão) são aguardadas diretamente.
+        """
+        for stage in self.stages:
+            if not stage.should_run(ctx):
+                continue
+            self._check_inputs(stage, ctx)
+            start = time.perf_counter()
+            if asyncio.iscoroutinefunction(stage.fn):
+                await stage.fn(ctx)
+            elif stage.inline:
+                stage.fn(ctx)
+            else:
+                await offload(stage.fn, ctx)
+            self._record(stage, ctx, time.perf_counter() - start)
+        return ctx
+
+    def run_sync(self, ctx: ReviewContext) -> ReviewContext:
+        """Executa as fases na thread atual (processos de avaliação em lote)"""
+        for stage in self.stages:
+            if not stage.should_run(ctx):
+                continue
+            if asyncio.iscoroutinefunction(stage.fn):
+                raise PipelineError(f"Fase assíncrona '{stage.name}' num pipeline síncrono")
+            self._check_inputs(stage, ctx)
+            start = time.perf_counter()
+            stage.fn(ctx)
+            self._record(stage, ctx, time.perf_counter() - start)
+        return ctx
+
+
+STAGE_NAMES = tuple(stage.name for stage in CORE_STAGES if not stage.inline)
@@ -0,0 +1,146 @@
+"""
+Escalonamento por prioridades das fases pesadas em CPU
+
+As fases pesadas (descodificação, Whisper, G2P, análise acústica, TTS,
+diagnósticos) pedem uma vaga ao escalonador antes de correrem numa
+thread. Quando há vagas em disputa ganha a classe mais prioritária:
+
+    interativo (revisões) > TTS > importações > diagnósticos
+
+- As classes não interativas nunca ocupam todas as vagas: ficam
+  CPU_RESERVED_INTERACTIVE vagas livres para as revisões
+- Enquanto houver revisões em curso ou em espera, nenhuma fase não
+  interativa arranca
+- As importações Excel correm noutro processo (pandas): o escalonador
+  publica a pressão interativa num valor partilhado e o processo de
+  importação cede o CPU entre sheets (ver import_jobs)
+"""
+import asyncio
+import heapq
+import itertools
+import multiprocessing
+import os
+import time
+from typing import Callable, Dict, List, Tuple
+
+import cpu_config
+
+INTERACTIVE = 0
+TTS = 1
+IMPORT = 2
+DIAGNOSTIC = 3
+PRIORITY_NAMES = {INTERACTIVE: "interactive", TTS: "tts", IMPORT: "import", DIAGNOSTIC: "diagnostic"}
+
+# Fases em simultâneo (0 = uma por core disponível)
+CPU_SCHEDULER_SLOTS = int(os.getenv("CPU_SCHEDULER_SLOTS", "0")) or cpu_config.available_cpus()
+# Vagas que as classes não interativas não podem ocupar
+CPU_RESERVED_INTERACTIVE = int(os.getenv("CPU_RESERVED_INTERACTIVE", "1"))
+
+
+class PriorityScheduler:
+    """Vagas de CPU atribuídas por prioridade (FIFO dentro de cada classe)"""
+
+    def __init__(self, slots: int = CPU_SCHEDULER_SLOTS, reserved: int = CPU_RESERVED_INTERACTIVE):
+        self.slots = max(1, slots)
+        self.bulk_slots = max(1, self.slots - reserved)
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._running = {priority: 0 for priority in PRIORITY_NAMES}
+        self._completed = {priority: 0 for priority in PRIORITY_NAMES}
+        self._wait_seconds = {priority: 0.0 for priority in PRIORITY_NAMES}
+        # Revisões em curso + em espera, lido pelo processo de importação
+        self.interactive_pressure = multiprocessing.get_context("spawn").Value("i", 0)
+
+    def _total_running(self) -> int:
+        return sum(self._running.values())
+
+    def _can_start(self, priority: int) -> bool:
+        if self._total_running() >= self.slots:
+            return False
+        if priority == INTERACTIVE:
+            return True
+        if self._running[INTERACTIVE] or any(p == INTERACTIVE for p, _, _ in self._waiters):
+            return False
+        return self._total_running() - self._running[INTERACTIVE] < self.bulk_slots
+
+    def _publish_pressure(self):
+        waiting = sum(1 for p, _, w in self._waiters if p == INTERACTIVE and not w.done())
+        self.interactive_pressure.value = self._running[INTERACTIVE] + waiting
+
+    def _dispatch(self):
+        """Entrega vagas livres aos pedidos em espera, por ordem de prioridade"""
+        while self._waiters:
+            priority, _, waiter = self._waiters[0]
+            if waiter.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._can_start(priority):
+                break
+            heapq.heappop(self._waiters)
+            self._running[priority] += 1
+            waiter.set_result(None)
+        self._publish_pressure()
+
+    async def acquire(self, priority: int):
+        if not self._waiters and self._can_start(priority):
+            self._running[priority] += 1
+            self._publish_pressure()
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+        # Pode haver vaga livre reservada às revisões, bloqueada só para as outras classes
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(priority)
+            else:
+                self._dispatch()
+            raise
+
+    def release(self, priority: int):
+        self._running[priority] -= 1
+        self._completed[priority] += 1
+        self._dispatch()
+
+    async def run(self, priority: int, fn: Callable, *args, **kwargs):
+        """Executa `fn(*args, **kwargs)` numa thread quando houver vaga para a classe"""
+        start = time.monotonic()
+        await self.acquire(priority)
+        self._wait_seconds[priority] += time.monotonic() - start
+        future = asyncio.ensure_future(asyncio.to_thread(fn, *args, **kwargs))
+        try:
+            result = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # A thread não pode ser interrompida: a vaga só fica livre quando terminar
+            future.add_done_callback(lambda _: self.release(priority))
+            raise
+        except BaseException:
+            self.release(priority)
+            raise
+        self.release(priority)
+        return result
+
+    def stats(self) -> Dict:
+        waiting = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, waiter in self._waiters:
+            if not waiter.done():
+                waiting[PRIORITY_NAMES[priority]] += 1
+        return {
+            "slots": self.slots,
+            "bulk_slots": self.bulk_slots,
+            "interactive_pressure": self.interactive_pressure.value,
+            "classes": {
+                name: {
+                    "running": self._running[priority],
+                    "waiting": waiting[name],
+                    "completed": self._completed[priority],
+                    "wait_seconds_total": round(self._wait_seconds[priority], 3),
+                }
+                for priority, name in PRIORITY_NAMES.items()
+            },
+        }
+
+
+cpu_scheduler = PriorityScheduler()
@@ -0,0 +1,409 @@
+"""
+Análise de fala partilhada pelos endpoints de revisão e pela avaliação em lote
+
+Funções sem efeitos secundários (não gravam revisões nem geram TTS):
+G2P, análise acústica, melhoria/corte do áudio, comparação de texto e
+rating (a transcrição fica em stt_backends). Não importa o app: os
+processos de avaliação em lote usam este módulo diretamente.
+"""
+import logging
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Dict, Optional
+
+import jellyfish
+import numpy as np
+from pydub import AudioSegment
+from pydub.effects import normalize as pydub_normalize
+
+from streaming import speech_bounds
+
+logger = logging.getLogger(__name__)
+
+# G2P - Phonemizer (carregado em background pelo app ou pelo worker de avaliação)
+phonemize = None
+G2P_AVAILABLE = False
+
+
+def load_g2p():
+    global phonemize, G2P_AVAILABLE
+    from phonemizer import phonemize as _phonemize
+    from phonemizer.backend import EspeakBackend
+
+    if not EspeakBackend.is_available():
+        raise RuntimeError("espeak-ng não encontrado")
+    phonemize = _phonemize
+    G2P_AVAILABLE = True
+    logger.info("✅ Phonemizer carregado com sucesso!")
+
+
+# ============================================
+# FUNÇÕES AUXILIARES - CONVERSÃO FONÉTICA (G2P)
+# ============================================
+def text_to_phonemes(text: str) -> str:
+    """
+    Converte texto em fonemas usando Phonemizer (espeak-ng)
+    """
+    if not text or not text.strip():
+        return ""
+    
+    if not G2P_AVAILABLE:
+        return ""
+    
+    try:
+        text_clean = text.strip().lower()
+        
+        phonemes = phonemize(
+            text_clean,
+            language='pt',
+            backend='espeak',
+            strip=True,
+            preserve_punctuation=False,
+            with_stress=False
+        )
+        
+        phonemes_clean = phonemes.strip()
+        logger.debug(f"[G2P] '{text_clean}' -> '{phonemes_clean}'")
+        return phonemes_clean
+        
+    except Exception as e:
+        logger.error(f"[G2P] Erro: {e}")
+        return ""
+
+def compare_phonemes(student_text: str, expected_text: str) -> Dict:
+    """
+    Compara textos pela representação fonética
+    """
+    student_phonemes = text_to_phonemes(student_text)
+    expected_phonemes = text_to_phonemes(expected_text)
+    
+    if not student_phonemes or not expected_phonemes:
+        return {
+            "phonetic_similarity": 0.0,
+            "student_phonemes": student_phonemes,
+            "expected_phonemes": expected_phonemes,
+            "g2p_available": False
+        }
+    
+    similarity = SequenceMatcher(None, student_phonemes, expected_phonemes).ratio() * 100
+    exact_match = student_phonemes == expected_phonemes
+    
+    logger.debug(f"[G2P] Esperado: '{expected_phonemes}', Recebido: '{student_phonemes}', Sim: {similarity:.1f}%")
+    
+    return {
+        "phonetic_similarity": round(similarity, 2),
+        "phonetic_exact_match": exact_match,
+        "student_phonemes": student_phonemes,
+        "expected_phonemes": expected_phonemes,
+        "g2p_available": True
+    }
+
+# ============================================
+# FUNÇÕES AUXILIARES - ANÁLISE ACÚSTICA
+# ============================================
+def analyze_audio_quality(audio_path: str) -> Dict:
+    """
+    Análise acústica básica do áudio
+    Detecta problemas antes do STT
+    """
+    import librosa
+
+    try:
+        y, sr = librosa.load(audio_path, sr=16000)
+        
+        # 1. Energia do sinal
+        rms_energy = np.mean(librosa.feature.rms(y=y))
+        has_voice = rms_energy > 0.01
+        
+        # 2. Duração
+        duration = librosa.get_duration(y=y, sr=sr)
+        
+        # 3. Taxa de zero-crossing (diferencia voz de ruído)
+        zcr = np.mean(librosa.feature.zero_crossing_rate(y))
+        
+        # 4. Espectrograma - distribuição de energia
+        spec = np.abs(librosa.stft(y))
+        spectral_centroid = np.mean(librosa.feature.spectral_centroid(S=spec))
+        
+        logger.info(f"[AUDIO] Energia: {rms_energy:.4f}, Duração: {duration:.2f}s, ZCR: {zcr:.4f}")
+        
+        return {
+            "has_voice": bool(has_voice),
+            "energy": float(rms_energy),
+            "duration_seconds": float(duration),
+            "zero_crossing_rate": float(zcr),
+            "spectral_centroid": float(spectral_centroid),
+            "quality_ok": bool(has_voice and duration > 0.2 and duration < 10.0)
+        }
+        
+    except Exception as e:
+        logger.error(f"[AUDIO] Erro na análise acústica: {e}")
+        return {"quality_ok": False, "error": str(e)}
+
+def enhance_audio_for_speech_recognition(audio_segment: AudioSegment) -> AudioSegment:
+    """
+    Melhora qualidade do áudio para reconhecimento
+    Otimizado para crianças e fonemas curtos
+    """
+    logger.info(f"[ENHANCE] Original: dBFS={audio_segment.dBFS:.1f}, dur={len(audio_segment)}ms")
+    
+    # 1. Normalizar volume
+    audio_segment = pydub_normalize(audio_segment)
+    
+    # 2. Remover silêncios
+    audio_segment = audio_segment.strip_silence(
+        silence_len=200,
+        silence_thresh=-50,
+        padding=100
+    )
+    
+    # 3. Aumentar volume se necessário
+    if audio_segment.dBFS < -15:
+        gain = -15 - audio_segment.dBFS
+        audio_segment = audio_segment.apply_gain(gain)
+        logger.info(f"[ENHANCE] Volume aumentado em {gain:.1f}dB")
+    
+    # 4. Se muito curto, repetir (IMPORTANTE para fonemas!)
+    if len(audio_segment) < 800:
+        original_dur = len(audio_segment)
+        silence = AudioSegment.silent(duration=100)
+        audio_segment = audio_segment + silence + audio_segment + silence + audio_segment
+        logger.info(f"[ENHANCE] ⚠️ Áudio curto ({original_dur}ms) REPETIDO 3x -> {len(audio_segment)}ms")
+    
+    # 5. Formato ideal
+    audio_segment = audio_segment.set_frame_rate(16000)
+    audio_segment = audio_segment.set_channels(1)
+    
+    logger.info(f"[ENHANCE] Final: dBFS={audio_segment.dBFS:.1f}, dur={len(audio_segment)}ms")
+    
+    return audio_segment
+
+def trim_to_speech(audio_segment: AudioSegment) -> AudioSegment:
+    """
+    Corta o silêncio antes e depois da fala (microfone esquecido a gravar):
+    menos áudio para o Whisper e clips dentro do limite de duração da análise acústica
+    """
+    samples = np.array(audio_segment.split_to_mono()[0].get_array_of_samples(), dtype=np.float32)
+    samples /= float(1 << (8 * audio_segment.sample_width - 1))
+    start, end = speech_bounds(samples, audio_segment.frame_rate)
+    if (start, end) == (0, len(samples)):
+        return audio_segment
+    trimmed = audio_segment[start * 1000 // audio_segment.frame_rate:end * 1000 // audio_segment.frame_rate]
+    logger.info(f"[AUDIO] ✂️ Silêncio cortado: {len(audio_segment)}ms -> {len(trimmed)}ms")
+    return trimmed
+
+# ============================================
+# FUNÇÕES AUXILIARES - NORMALIZAÇÃO E AVALIAÇÃO
+# ============================================
+def normalize_text_strict(text: str) -> str:
+    text = text.strip()
+    return ' '.join(text.split())
+
+def normalize_text_lenient(text: str) -> str:
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+    text = text.lower()
+    text = re.sub(r'[^\w\s]', '', text)
+    return ' '.join(text.split())
+
+def analyze_text_quality(
+    student_text: str, expected_text: str, use_phonetic: bool = False, phonetic_analysis: Optional[Dict] = None
+) -> Dict:
+    """
+    Análise completa da qualidade da resposta
+    Suporta análise fonética via G2P (`phonetic_analysis`: comparação já
+    calculada pela fase g2p do pipeline)
+    """
+    student_clean = student_text.strip().lower()
+    expected_clean = expected_text.strip().lower()
+    
+    # Proteção contra texto vazio
+    if not student_clean:
+        return {
+            "content_similarity": 0.0,
+            "exact_similarity": 0.0,
+            "jaro_winkler_similarity": 0.0,
+            "phonetic_match": False,
+            "phonetic_similarity": 0.0,
+            "length_ratio": 0.0,
+            "length_score": 0.0,
+            "keyword_coverage": 0.0,
+            "composite_score": 0.0,
+            "student_words_count": 0,
+            "expected_words_count": len(expected_clean.split()),
+            "g2p_used": False
+        }
+
+    # Análise fonética tradicional (jellyfish)
+    metaphone_student = jellyfish.metaphone(student_clean)
+    metaphone_expected = jellyfish.metaphone(expected_clean)
+    phonetic_match = metaphone_student == metaphone_expected
+    jaro_score = jellyfish.jaro_winkler_similarity(student_clean, expected_clean) * 100
+
+    # Similaridades textuais
+    content_similarity = SequenceMatcher(None, normalize_text_lenient(student_text), normalize_text_lenient(expected_text)).ratio() * 100
+    exact_similarity = SequenceMatcher(None, normalize_text_strict(student_text), normalize_text_strict(expected_text)).ratio() * 100
+
+    expected_words = normalize_text_lenient(expected_text).split()
+    student_words = normalize_text_lenient(student_text).split()
+    length_ratio = len(student_words) / max(len(expected_words), 1)
+    length_score = 100 if 0.8 <= length_ratio <= 1.2 else max(0, 100 - abs(length_ratio - 1) * 50)
+    keyword_coverage = (sum(1 for word in expected_words if word in student_words) / len(expected_words) * 100) if expected_words else 100
+
+    # ANÁLISE FONÉTICA AVANÇADA (G2P)
+    phonetic_similarity = 0.0
+    g2p_used = False
+    
+    if use_phonetic and G2P_AVAILABLE:
+        phonetic_analysis = phonetic_analysis or compare_phonemes(student_text, expected_text)
+        if phonetic_analysis.get("g2p_available", False):
+            phonetic_similarity = phonetic_analysis["phonetic_similarity"]
+            g2p_used = True
+            
+            if phonetic_analysis.get("phonetic_exact_match", False):
+                phonetic_match = True
+                phonetic_similarity = 100.0
+
+    # CÁLCULO DO SCORE COMPOSTO
+    if len(expected_clean) <= 3:
+        # Fonemas curtos: priorizar análise fonética
+        if phonetic_match:
+            composite_score = 100.0
+            content_similarity = 100.0
+        elif g2p_used and phonetic_similarity >= 80:
+            composite_score = phonetic_similarity
+        elif jaro_score >= 70:
+            composite_score = jaro_score
+        else:
+            if g2p_used:
+                composite_score = phonetic_similarity * 0.5 + jaro_score * 0.3 + content_similarity * 0.2
+            else:
+                composite_score = jaro_score * 0.8 + content_similarity * 0.2
+    else:
+        # Textos longos: combinação balanceada
+        if g2p_used:
+            composite_score = (
+                content_similarity * 0.30 +
+                exact_similarity * 0.15 +
+                length_score * 0.10 +
+                keyword_coverage * 0.10 +
+                jaro_score * 0.15 +
+                phonetic_similarity * 0.20
+            )
+        else:
+            phonetic_weight = min(0.4, len(expected_clean) / 20)
+            composite_score = (
+                content_similarity * 0.40 +
+                exact_similarity * 0.20 +
+                length_score * 0.15 +
+                keyword_coverage * 0.15 +
+                jaro_score * phonetic_weight
+            )
+
+    return {
+        "content_similarity": round(content_similarity, 2),
+        "exact_similarity": round(exact_similarity, 2),
+        "jaro_winkler_similarity": round(jaro_score, 2),
+        "phonetic_match": phonetic_match,
+        "phonetic_similarity": round(phonetic_similarity, 2),
+        "length_ratio": round(length_ratio, 2),
+        "length_score": round(length_score, 2),
+        "keyword_coverage": round(keyword_coverage, 2),
+        "composite_score": round(composite_score, 2),
+        "student_words_count": len(student_words),
+        "expected_words_count": len(expected_words),
+        "g2p_used": g2p_used
+    }
+
+def get_rating_from_analysis(analysis: Dict) -> int:
+    """
+    Converte score em rating (1-4)
+    """
+    score = analysis["composite_score"]
+    content_sim = analysis["content_similarity"]
+    
+    # Bonus se G2P confirmar
+    if analysis.get("g2p_used", False) and analysis.get("phonetic_similarity", 0) >= 90:
+        return 4
+    
+    if score >= 90 and content_sim >= 88:
+        return 4
+    elif score >= 75 and content_sim >= 70:
+        return 3
+    elif score >= 50 or (content_sim >= 60 and analysis["length_ratio"] >= 0.5):
+        return 2
+    else:
+        return 1
+
+def get_feedback_message(rating: int, analysis: Dict) -> str:
+    """
+    Mensagem de feedback baseada no rating
+    """
+    if rating == 4:
+        return "Excelente! Resposta quase perfeita."
+    elif rating == 3:
+        if analysis["exact_similarity"] < 85:
+            return "Muito bem! Atenção a pequenos detalhes."
+        else:
+            return "Muito bem! Resposta correta."
+    elif rating == 2:
+        if analysis["length_ratio"] < 0.6:
+            return "Resposta incompleta. Tenta incluir mais."
+        elif analysis["keyword_coverage"] < 60:
+            return "Faltam alguns conceitos. Revê o conteúdo."
+        else:
+            return "Resposta parcial. Continua a praticar."
+    else:
+        if analysis["length_ratio"] < 0.3:
+            return "Resposta muito incompleta."
+        else:
+            return "Resposta incorreta. Estuda novamente."
+
+def rate_phoneme_attempt(analysis: Dict, expected_text: str, threshold: float):
+    """
+    Avaliação de fonemas/palavras ditas pela criança
+    Devolve (is_correct, rating, feedback_msg, feedback_type)
+    """
+    # Fonemas curtos: basta uma das medidas fonéticas/textuais concordar
+    if len(expected_text.strip()) <= 3:
+        g2p_sim = analysis.get("phonetic_similarity", 0)
+        
+        is_correct = (
+            analysis["phonetic_match"] or
+            (analysis.get("g2p_used", False) and g2p_sim >= 75) or
+            analysis["jaro_winkler_similarity"] >= 70 or
+            analysis["content_similarity"] >= 60
+        )
+        
+        logger.debug(f"[FONEMA] Lógica curta: phonetic={analysis['phonetic_match']}, " +
+                   f"g2p={g2p_sim}, jaro={analysis['jaro_winkler_similarity']}, " +
+                   f"content={analysis['content_similarity']} -> {is_correct}")
+    else:
+        is_correct = analysis["composite_score"] >= threshold
+    
+    if is_correct:
+        return True, 4 if analysis["composite_score"] >= 90 else 3, "Muito bem! 🎉", "correct"
+    if analysis["composite_score"] >= 40:
+        return False, 2, "Quase lá! Tenta outra vez! 😊", "partial"
+    return False, 1, "Vamos tentar de novo! 💪", "incorrect"
+
+def normalize_spelling(transcription: str) -> str:
+    """
+    Soletração: "b o l a" fica como está; uma palavra inteira ("bola")
+    é separada em letras ("b o l a") para comparar com o esperado
+    """
+    normalized = normalize_text_lenient(transcription)
+    if " " not in normalized and len(normalized) > 1:
+        normalized = " ".join(list(normalized))
+        logger.debug(f"[SPELLING] Separado em letras: '{normalized}'")
+    return normalized
+
+def spelling_feedback(analysis: Dict):
+    """Feedback específico para spelling: (feedback_msg, feedback_type)"""
+    content_sim = analysis["content_similarity"]
+    if content_sim >= 80:
+        return "Muito bem! Soletrado corretamente! 🎉", "correct"
+    if content_sim >= 50:
+        return "Quase! Algumas letras estão certas. 😊", "partial"
+    return "Vamos tentar de novo! 💪", "incorrect"
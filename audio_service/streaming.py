@@ -0,0 +1,240 @@
+"""
+Transcrição em streaming (WebSocket)
+
+O cliente envia o áudio em blocos PCM 16-bit mono à medida que grava; a
+sessão acumula as amostras, deteta voz (VAD por energia) e decide quando
+vale a pena uma transcrição parcial sobre a janela deslizante mais
+recente. As parciais são estabilizadas por concordância local: só se dá
+como "confirmado" o prefixo de palavras igual em duas hipóteses seguidas.
+
+- STREAM_PARTIAL_INTERVAL: segundos de áudio novo entre parciais
+- STREAM_WINDOW_SECONDS: janela (mais recente) usada nas parciais
+- STREAM_MAX_SECONDS: duração máxima de uma sessão
+
+Endpointing: depois de haver voz, um silêncio contínuo de
+ENDPOINT_SILENCE_MS termina a gravação (o servidor avisa o cliente para
+parar) e o silêncio final é cortado antes da transcrição e da análise
+acústica. Sem voz durante ENDPOINT_NO_SPEECH_SECONDS a sessão também termina.
+"""
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+WHISPER_SAMPLE_RATE = 16000
+# Taxas de amostragem aceites para o PCM enviado pelo cliente
+SAMPLE_RATE_MIN = 8000
+SAMPLE_RATE_MAX = 48000
+
+STREAM_PARTIAL_INTERVAL = float(os.getenv("STREAM_PARTIAL_INTERVAL", "0.8"))
+STREAM_WINDOW_SECONDS = float(os.getenv("STREAM_WINDOW_SECONDS", "8"))
+STREAM_MAX_SECONDS = float(os.getenv("STREAM_MAX_SECONDS", "15"))
+
+# VAD: frames de 30 ms; voz = RMS acima do ruído de fundo e do mínimo absoluto
+VAD_FRAME_MS = 30
+VAD_MIN_ENERGY = float(os.getenv("VAD_MIN_ENERGY", "0.01"))
+VAD_NOISE_RATIO = float(os.getenv("VAD_NOISE_RATIO", "3.0"))
+# Margem de áudio mantida antes do início da voz
+VAD_PADDING_MS = 200
+
+ENDPOINT_SILENCE_MS = int(os.getenv("ENDPOINT_SILENCE_MS", "800"))
+# Limites do endpoint_silence_ms pedido pelo cliente: abaixo corta na primeira
+# pausa, acima deixa de haver endpointing na prática
+ENDPOINT_SILENCE_MIN_MS = 200
+ENDPOINT_SILENCE_MAX_MS = 5000
+# Voz mínima para um endpoint (evita cortar num clique ou num "hã")
+ENDPOINT_MIN_SPEECH_MS = int(os.getenv("ENDPOINT_MIN_SPEECH_MS", "150"))
+ENDPOINT_NO_SPEECH_SECONDS = float(os.getenv("ENDPOINT_NO_SPEECH_SECONDS", "6"))
+# Margem de áudio mantida depois do fim da voz
+ENDPOINT_TRAILING_MS = 300
+
+
+class EnergyVAD:
+    """Deteção de voz por energia com ruído de fundo adaptativo"""
+
+    def __init__(self, sample_rate: int, min_energy: float = VAD_MIN_ENERGY, noise_ratio: float = VAD_NOISE_RATIO):
+        self.frame_size = int(sample_rate * VAD_FRAME_MS / 1000)
+        self.min_energy = min_energy
+        self.noise_ratio = noise_ratio
+        self.noise_floor: Optional[float] = None
+        self.frames = 0
+        self.speech_frames = 0
+        self.first_speech_frame: Optional[int] = None
+        self.last_speech_frame: Optional[int] = None
+
+    def is_speech(self, rms: float) -> bool:
+        if self.noise_floor is None:
+            # Começa no mínimo absoluto: a fala pode começar logo no primeiro frame
+            self.noise_floor = min(rms, self.min_energy / self.noise_ratio)
+        speech = rms > max(self.min_energy, self.noise_ratio * self.noise_floor)
+        if not speech:
+            # O ruído de fundo só aprende com frames sem voz
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * rms
+        return speech
+
+    def process(self, frames: np.ndarray) -> bool:
+        """`frames`: (n, frame_size) float32; devolve True se houve voz"""
+        rms = np.sqrt(np.mean(frames ** 2, axis=1))
+        voiced = False
+        for value in rms:
+            if self.is_speech(float(value)):
+                voiced = True
+                self.speech_frames += 1
+                if self.first_speech_frame is None:
+                    self.first_speech_frame = self.frames
+                self.last_speech_frame = self.frames
+            self.frames += 1
+        return voiced
+
+    @property
+    def speech_started(self) -> bool:
+        return self.first_speech_frame is not None
+
+    @property
+    def trailing_silence_ms(self) -> int:
+        if self.last_speech_frame is None:
+            return 0
+        return (self.frames - self.last_speech_frame - 1) * VAD_FRAME_MS
+
+    def bounds(self, total_samples: int, sample_rate: int) -> Tuple[int, int]:
+        """Amostras [início, fim) da fala, com margens; toda a gravação se não houve voz"""
+        if not self.speech_started:
+            return 0, total_samples
+        start = self.first_speech_frame * self.frame_size - int(sample_rate * VAD_PADDING_MS / 1000)
+        end = (self.last_speech_frame + 1) * self.frame_size + int(sample_rate * ENDPOINT_TRAILING_MS / 1000)
+        return max(0, start), min(total_samples, end)
+
+
+def speech_bounds(samples: np.ndarray, sample_rate: int) -> Tuple[int, int]:
+    """Início e fim da fala num clip completo (para uploads: corta silêncio inicial e final)"""
+    vad = EnergyVAD(sample_rate)
+    complete = (samples.size // vad.frame_size) * vad.frame_size
+    if complete:
+        vad.process(samples[:complete].reshape(-1, vad.frame_size))
+    return vad.bounds(samples.size, sample_rate)
+
+
+def resample(samples: np.ndarray, sample_rate: int, target_rate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+    """Reamostragem linear (suficiente para voz; o cliente deve enviar 16 kHz quando puder)"""
+    if sample_rate == target_rate or samples.size == 0:
+        return samples
+    duration = samples.size / sample_rate
+    target = np.linspace(0, duration, int(duration * target_rate), endpoint=False)
+    source = np.arange(samples.size) / sample_rate
+    return np.interp(target, source, samples).astype(np.float32)
+
+
+def agreed_prefix(previous: str, current: str) -> str:
+    """Prefixo de palavras comum a duas hipóteses (concordância local)"""
+    agreed: List[str] = []
+    for a, b in zip(previous.split(), current.split()):
+        if a.lower().strip(".,!?") != b.lower().strip(".,!?"):
+            break
+        agreed.append(b)
+    return " ".join(agreed)
+
+
+class StreamingSession:
+    """Áudio recebido numa sessão WebSocket e estado das transcrições parciais"""
+
+    def __init__(self, sample_rate: int = WHISPER_SAMPLE_RATE, endpoint_silence_ms: int = ENDPOINT_SILENCE_MS):
+        if not SAMPLE_RATE_MIN <= sample_rate <= SAMPLE_RATE_MAX:
+            raise ValueError(f"sample_rate deve estar entre {SAMPLE_RATE_MIN} e {SAMPLE_RATE_MAX}")
+        if not ENDPOINT_SILENCE_MIN_MS <= endpoint_silence_ms <= ENDPOINT_SILENCE_MAX_MS:
+            raise ValueError(
+                f"endpoint_silence_ms deve estar entre {ENDPOINT_SILENCE_MIN_MS} e {ENDPOINT_SILENCE_MAX_MS}"
+            )
+        self.sample_rate = sample_rate
+        self.endpoint_silence_ms = endpoint_silence_ms
+        self.vad = EnergyVAD(sample_rate)
+        self._chunks: List[np.ndarray] = []
+        self._pending = np.zeros(0, dtype=np.float32)
+        self.samples = 0
+        self._samples_at_partial = 0
+        self.partials = 0
+        self.hypothesis = ""
+        self.committed = ""
+
+    @property
+    def seconds(self) -> float:
+        return self.samples / self.sample_rate
+
+    @property
+    def full(self) -> bool:
+        return self.seconds >= STREAM_MAX_SECONDS
+
+    def append(self, pcm16: bytes) -> bool:
+        """Acrescenta um bloco PCM 16-bit LE; devolve True se o bloco teve voz"""
+        if len(pcm16) % 2:
+            pcm16 = pcm16[:-1]
+        samples = np.frombuffer(pcm16, dtype="<i2").astype(np.float32) / 32768.0
+        self._chunks.append(samples)
+        self.samples += samples.size
+
+        # VAD só sobre frames completos; o resto fica para o bloco seguinte
+        pending = np.concatenate([self._pending, samples])
+        size = self.vad.frame_size
+        complete = (pending.size // size) * size
+        self._pending = pending[complete:]
+        if not complete:
+            return False
+        return self.vad.process(pending[:complete].reshape(-1, size))
+
+    def audio(self) -> np.ndarray:
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        return self._chunks[0] if self._chunks else np.zeros(0, dtype=np.float32)
+
+    def endpoint_reason(self) -> Optional[str]:
+        """Motivo para terminar a gravação, ou None enquanto deve continuar"""
+        if self.full:
+            return "max_duration"
+        if not self.vad.speech_started:
+            return "no_speech" if self.seconds >= ENDPOINT_NO_SPEECH_SECONDS else None
+        speech_ms = self.vad.speech_frames * VAD_FRAME_MS
+        if speech_ms >= ENDPOINT_MIN_SPEECH_MS and self.vad.trailing_silence_ms >= self.endpoint_silence_ms:
+            return "endpoint"
+        return None
+
+    def utterance(self) -> np.ndarray:
+        """Fala (16 kHz) sem o silêncio inicial e final, para a transcrição final"""
+        audio = self.audio()
+        start, end = self.vad.bounds(audio.size, self.sample_rate)
+        return resample(audio[start:end], self.sample_rate)
+
+    def window(self) -> np.ndarray:
+        """Janela deslizante mais recente da fala (16 kHz), para as parciais"""
+        audio = self.audio()
+        start, _ = self.vad.bounds(audio.size, self.sample_rate)
+        start = max(start, audio.size - int(STREAM_WINDOW_SECONDS * self.sample_rate))
+        return resample(audio[start:], self.sample_rate)
+
+    def partial_due(self) -> bool:
+        """Há voz e áudio novo suficiente desde a última parcial"""
+        if not self.vad.speech_started:
+            return False
+        return (self.samples - self._samples_at_partial) / self.sample_rate >= STREAM_PARTIAL_INTERVAL
+
+    def mark_partial(self):
+        self._samples_at_partial = self.samples
+
+    def update_hypothesis(self, text: str) -> Tuple[str, str]:
+        """Regista a parcial; devolve (confirmado, provisório)"""
+        self.partials += 1
+        agreed = agreed_prefix(self.hypothesis, text)
+        if len(agreed) > len(self.committed):
+            self.committed = agreed
+        self.hypothesis = text
+        words = text.split()
+        tentative = " ".join(words[len(self.committed.split()):])
+        return self.committed, tentative
+
+    def stats(self) -> dict:
+        speech_seconds = self.vad.speech_frames * VAD_FRAME_MS / 1000
+        start, end = self.vad.bounds(self.samples, self.sample_rate)
+        return {
+            "audio_seconds": round(self.seconds, 2),
+            "speech_seconds": round(speech_seconds, 2),
+            "trimmed_seconds": round((self.samples - (end - start)) / self.sample_rate, 2),
+            "partials": self.partials,
+        }
@@ -0,0 +1,315 @@
+"""
+Motores de reconhecimento de fala (STT) intercambiáveis
+
+Todos implementam `transcribe(audio, language, hint, fast, word_timestamps)`
+e devolvem um `Transcript` (texto + palavras com tempos e probabilidade).
+`audio` é o caminho de um ficheiro ou amostras float32 a 16 kHz.
+
+- whisper[:tamanho]  faster-whisper (tiny, base, small, medium...). O tamanho
+                     WHISPER_MODEL_SIZE usa o servidor do modelo partilhado
+                     quando há vários workers; os outros carregam no processo
+- vosk[:caminho]     modelo Kaldi/Vosk pequeno com gramática restrita às
+                     palavras esperadas (keyword spotting, para fonemas);
+                     VOSK_MODEL_PATH por omissão, requer o pacote `vosk`
+- fake               determinístico e sem modelo: devolve o texto esperado
+                     (ou STT_FAKE_TEXT) quando há voz; para testes,
+                     benchmarks e CI
+
+Seleção por tipo de cartão: STT_BACKEND (omissão "whisper") e
+STT_BACKEND_<TIPO> (ex. STT_BACKEND_FONEMA=vosk). As parciais do streaming
+usam STT_BACKEND_STREAM (por omissão, o motor do fonema).
+"""
+import abc
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from model_server import WHISPER_MODEL_SIZE
+from streaming import WHISPER_SAMPLE_RATE, EnergyVAD
+
+logger = logging.getLogger(__name__)
+
+BACKEND_NAMES = ("whisper", "vosk", "fake")
+STT_BACKEND = os.getenv("STT_BACKEND", "whisper")
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "/root/.cache/vosk/vosk-model-small-pt-0.3")
+STT_FAKE_TEXT = os.getenv("STT_FAKE_TEXT", "")
+# Latência simulada do motor fake (benchmarks do resto do pipeline)
+STT_FAKE_LATENCY_MS = int(os.getenv("STT_FAKE_LATENCY_MS", "0"))
+
+Audio = Union[str, np.ndarray]
+
+
+@dataclass
+class Word:
+    text: str
+    start: float
+    end: float
+    probability: float
+
+
+@dataclass
+class Transcript:
+    text: str
+    words: List[Word] = field(default_factory=list)
+    backend: str = ""
+
+    @property
+    def confidence(self) -> Optional[float]:
+        """Probabilidade média das palavras (None sem tempos por palavra)"""
+        if not self.words:
+            return None
+        return sum(word.probability for word in self.words) / len(self.words)
+
+
+def load_samples(audio: Audio) -> np.ndarray:
+    """Amostras float32 mono a 16 kHz de um ficheiro ou de um array já nesse formato"""
+    if isinstance(audio, np.ndarray):
+        return audio.astype(np.float32, copy=False)
+    from pydub import AudioSegment
+
+    segment = AudioSegment.from_file(audio).set_channels(1).set_frame_rate(WHISPER_SAMPLE_RATE).set_sample_width(2)
+    return np.frombuffer(segment.raw_data, dtype="<i2").astype(np.float32) / 32768.0
+
+
+# ============================================
+# MOTORES
+# ============================================
+class STTBackend(abc.ABC):
+    """Interface comum dos motores STT"""
+
+    name = ""
+
+    @abc.abstractmethod
+    def transcribe(
+        self,
+        audio: Audio,
+        language: str = "pt",
+        hint: Optional[str] = None,
+        fast: bool = False,
+        word_timestamps: bool = True,
+    ) -> Transcript:
+        """
+        `hint`: texto esperado (usado pelos motores de vocabulário restrito)
+        `fast`: transcrição parcial do streaming (menor latência, menos precisa)
+        """
+
+    def info(self) -> Dict:
+        return {"backend": self.name}
+
+
+class WhisperBackend(STTBackend):
+    """faster-whisper (WhisperModel local ou RemoteWhisperModel do servidor do modelo)"""
+
+    def __init__(self, model, size: str):
+        self.model = model
+        self.size = size
+        self.name = f"whisper:{size}"
+
+    def transcribe(self, audio, language="pt", hint=None, fast=False, word_timestamps=True) -> Transcript:
+        if fast:
+            options = {"beam_size": 1, "best_of": 1, "temperature": 0.0, "condition_on_previous_text": False}
+        else:
+            options = {"beam_size": 5, "best_of": 5, "temperature": 0.0}
+            if word_timestamps:
+                options["word_timestamps"] = True
+        # O gerador do faster-whisper só descodifica à medida que é consumido
+        segments = list(self.model.transcribe(audio, language=language, **options)[0])
+        words = [
+            Word(word.word.strip(), word.start, word.end, getattr(word, "probability", 0.5))
+            for segment in segments
+            for word in getattr(segment, "words", None) or []
+        ]
+        return Transcript("".join(segment.text for segment in segments).strip(), words, self.name)
+
+    def info(self) -> Dict:
+        info = {"backend": self.name}
+        info.update(getattr(self.model, "info", None) or {})
+        return info
+
+
+class VoskBackend(STTBackend):
+    """
+    Vosk (Kaldi) com gramática restrita às palavras do texto esperado mais
+    "[unk]": só reconhece o que se espera ouvir, o que chega para fonemas e
+    palavras isoladas com um modelo pequeno e rápido
+    """
+
+    def __init__(self, model_path: str = VOSK_MODEL_PATH):
+        from vosk import Model, SetLogLevel
+
+        SetLogLevel(-1)
+        self.model_path = model_path
+        self.model = Model(model_path)
+        self.name = "vosk"
+
+    def transcribe(self, audio, language="pt", hint=None, fast=False, word_timestamps=True) -> Transcript:
+        from vosk import KaldiRecognizer
+
+        if hint:
+            grammar = sorted({word.strip(".,!?").lower() for word in hint.split()} - {""}) + ["[unk]"]
+            recognizer = KaldiRecognizer(self.model, WHISPER_SAMPLE_RATE, json.dumps(grammar, ensure_ascii=False))
+        else:
+            recognizer = KaldiRecognizer(self.model, WHISPER_SAMPLE_RATE)
+        recognizer.SetWords(True)
+
+        pcm = (np.clip(load_samples(audio), -1.0, 1.0) * 32767).astype("<i2").tobytes()
+        chunk = WHISPER_SAMPLE_RATE // 2 * 2
+        for i in range(0, len(pcm), chunk):
+            recognizer.AcceptWaveform(pcm[i:i + chunk])
+        result = json.loads(recognizer.FinalResult())
+
+        words = [
+            Word(item["word"], item["start"], item["end"], item.get("conf", 1.0))
+            for item in result.get("result", [])
+            if item["word"] != "[unk]"
+        ]
+        return Transcript(" ".join(word.text for word in words), words, self.name)
+
+    def info(self) -> Dict:
+        return {"backend": self.name, "model_path": self.model_path}
+
+
+class FakeBackend(STTBackend):
+    """Determinístico: sem voz devolve "", com voz o texto fixo ou o esperado"""
+
+    def __init__(self, text: str = STT_FAKE_TEXT, latency_ms: int = STT_FAKE_LATENCY_MS):
+        self.text = text
+        self.latency_ms = latency_ms
+        self.name = "fake"
+
+    def transcribe(self, audio, language="pt", hint=None, fast=False, word_timestamps=True) -> Transcript:
+        samples = load_samples(audio)
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        vad = EnergyVAD(WHISPER_SAMPLE_RATE)
+        complete = (samples.size // vad.frame_size) * vad.frame_size
+        if complete:
+            vad.process(samples[:complete].reshape(-1, vad.frame_size))
+        text = (self.text or hint or "") if vad.speech_started else ""
+
+        # Palavras distribuídas uniformemente pela fala detetada
+        start, end = vad.bounds(samples.size, WHISPER_SAMPLE_RATE)
+        tokens = text.split()
+        step = (end - start) / WHISPER_SAMPLE_RATE / max(1, len(tokens))
+        offset = start / WHISPER_SAMPLE_RATE
+        words = [
+            Word(token, round(offset + i * step, 2), round(offset + (i + 1) * step, 2), 0.9)
+            for i, token in enumerate(tokens)
+        ] if word_timestamps else []
+        return Transcript(text, words, self.name)
+
+    def info(self) -> Dict:
+        return {"backend": self.name, "text": self.text or "(esperado)", "latency_ms": self.latency_ms}
+
+
+# ============================================
+# REGISTO E SELEÇÃO POR TIPO DE CARTÃO
+# ============================================
+_backends: Dict[str, STTBackend] = {}
+_errors: Dict[str, str] = {}
+_lock = threading.Lock()
+
+
+def normalize_spec(spec: str) -> str:
+    """"whisper" -> "whisper:<WHISPER_MODEL_SIZE>"; ValueError para motores desconhecidos"""
+    name, _, arg = spec.strip().lower().partition(":")
+    if name not in BACKEND_NAMES:
+        raise ValueError(f"Motor STT desconhecido: '{spec}' (disponíveis: {', '.join(BACKEND_NAMES)})")
+    if name == "whisper":
+        return f"whisper:{arg or WHISPER_MODEL_SIZE}"
+    if name == "vosk" and arg:
+        # O caminho do modelo mantém maiúsculas
+        return "vosk:" + spec.strip().partition(":")[2]
+    return name
+
+
+def backend_spec(card_type: str) -> str:
+    """Motor configurado para um tipo de cartão (ou "stream" para as parciais)"""
+    default = STT_BACKEND
+    if card_type == "stream":
+        default = os.getenv("STT_BACKEND_FONEMA", STT_BACKEND)
+    return normalize_spec(os.getenv(f"STT_BACKEND_{card_type.upper()}", default))
+
+
+def create_backend(spec: str, cpu_threads: Optional[int] = None, num_workers: Optional[int] = None) -> STTBackend:
+    name, _, arg = normalize_spec(spec).partition(":")
+    if name == "whisper":
+        from model_server import RemoteWhisperModel, connect, create_whisper_model
+
+        manager = connect() if arg == WHISPER_MODEL_SIZE else None
+        if manager is not None:
+            logger.info("🔄 A ligar ao servidor do modelo Whisper...")
+            return WhisperBackend(RemoteWhisperModel(manager), arg)
+        logger.info(f"🔄 A carregar modelo Whisper '{arg}' (STT)...")
+        options = {"model_size": arg, "cpu_threads": cpu_threads}
+        if num_workers is not None:
+            options["num_workers"] = num_workers
+        return WhisperBackend(create_whisper_model(**options), arg)
+    if name == "vosk":
+        return VoskBackend(arg or VOSK_MODEL_PATH)
+    return FakeBackend()
+
+
+def get(spec: str, **options) -> STTBackend:
+    """Motor carregado uma vez por processo (carrega-o se ainda não existir)"""
+    key = normalize_spec(spec)
+    with _lock:
+        if key not in _backends:
+            _backends[key] = create_backend(key, **options)
+            _errors.pop(key, None)
+            logger.info(f"✅ Motor STT '{key}' carregado.")
+        return _backends[key]
+
+
+def load_configured(card_types: Iterable[str], **options) -> List[str]:
+    """
+    Carrega os motores configurados para os tipos de cartão. Um motor que
+    falha só afeta os tipos que o usam (ficam sem STT, como antes sem
+    Whisper, até uma nova chamada o carregar); erro apenas se nenhum carregar
+    Os motores já carregados não voltam a ser criados
+    """
+    specs = sorted({backend_spec(card_type) for card_type in card_types})
+    loaded = []
+    for spec in specs:
+        try:
+            get(spec, **options)
+            loaded.append(spec)
+        except Exception as e:
+            _errors[spec] = str(e)
+            logger.error(f"❌ Motor STT '{spec}' indisponível: {e}")
+    if not loaded:
+        raise RuntimeError(f"Nenhum motor STT disponível: {_errors}")
+    return loaded
+
+
+def for_card_type(card_type: str) -> Optional[STTBackend]:
+    """Motor já carregado para o tipo de cartão (None = STT indisponível)"""
+    return _backends.get(backend_spec(card_type))
+
+
+def unavailable(card_types: Iterable[str]) -> Dict[str, str]:
+    """Tipos de cartão cujo motor configurado falhou a carregar -> erro"""
+    return {
+        card_type: _errors[backend_spec(card_type)]
+        for card_type in card_types
+        if backend_spec(card_type) in _errors
+    }
+
+
+def available() -> bool:
+    return bool(_backends)
+
+
+def report(card_types: Iterable[str] = ()) -> Dict:
+    return {
+        "selection": {card_type: backend_spec(card_type) for card_type in card_types},
+        "loaded": {key: backend.info() for key, backend in _backends.items()},
+        "errors": dict(_errors),
+    }
@@ -0,0 +1,162 @@
+"""
+Tracing de pedidos (spans ao estilo OpenTelemetry, sem dependências)
+
+Cada pedido HTTP abre um span "server"; a revisão, cada fase do pipeline,
+a geração de TTS e o registo no valcoin ficam como spans filhos do mesmo
+trace. O contexto segue o formato W3C Trace Context:
+
+- um header `traceparent` recebido continua o trace do cliente
+- os pedidos ao valcoin_admin_server levam `traceparent` do span atual
+- as respostas levam `X-Trace-Id` (o id a pedir quando alguém reporta lentidão)
+
+Exportação local (TRACE_EXPORTER):
+- none     só propagação e X-Trace-Id (omissão)
+- console  uma linha [TRACE] no log por span
+- file     JSON lines em TRACE_FILE (campos dos spans OTLP/JSON)
+"""
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORTERS = ("none", "console", "file")
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none").lower()
+TRACE_FILE = Path(os.getenv("TRACE_FILE", "traces/spans.jsonl"))
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "audio_service")
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+_file_lock = threading.Lock()
+
+if TRACE_EXPORTER not in TRACE_EXPORTERS:
+    logger.warning(f"[TRACE] TRACE_EXPORTER '{TRACE_EXPORTER}' desconhecido, a usar 'none'")
+    TRACE_EXPORTER = "none"
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    kind: str = "internal"
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    attributes: Dict = field(default_factory=dict)
+    status: str = "ok"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return round((end_ns - self.start_ns) / 1e6, 1)
+
+    def to_dict(self) -> Dict:
+        return {
+            "service": SERVICE_NAME,
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def extract(headers: Mapping) -> Optional[Tuple[str, str]]:
+    """(trace_id, span_id) do header traceparent recebido, se válido"""
+    match = _TRACEPARENT.match((headers.get("traceparent") or "").strip().lower())
+    if not match or set(match.group(1)) == {"0"} or set(match.group(2)) == {"0"}:
+        return None
+    return match.group(1), match.group(2)
+
+
+def inject(headers: Dict) -> Dict:
+    """Acrescenta o traceparent do span atual aos headers de um pedido de saída"""
+    span = _current.get()
+    if span is not None:
+        headers["traceparent"] = span.traceparent
+    return headers
+
+
+def _new_span(name: str, kind: str, parent: Optional[Tuple[str, str]], attributes: Dict) -> Span:
+    if parent is None and _current.get() is not None:
+        parent = (_current.get().trace_id, _current.get().span_id)
+    trace_id, parent_id = parent if parent else (secrets.token_hex(16), None)
+    return Span(name, trace_id, secrets.token_hex(8), parent_id, kind, attributes=attributes)
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", parent: Optional[Tuple[str, str]] = None, **attributes) -> Iterator[Span]:
+    """
+    Span à volta de um bloco (filho do span atual, ou de `parent` vindo de
+    extract()); exceções marcam o span com erro e propagam-se
+    """
+    current = _new_span(name, kind, parent, attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current.reset(token)
+        current.end_ns = time.time_ns()
+        _export(current)
+
+
+def record(name: str, seconds: float, **attributes) -> Span:
+    """Span já terminado (ex. fase do pipeline medida pelo próprio pipeline)"""
+    current = _new_span(name, "internal", None, attributes)
+    current.end_ns = time.time_ns()
+    current.start_ns = current.end_ns - int(seconds * 1e9)
+    _export(current)
+    return current
+
+
+def stage_hook(stage: str, ctx, seconds: float):
+    """Hook do pipeline de revisão: um span por fase, filho do span da revisão"""
+    record(f"stage.{stage}", seconds, stage=stage, card_type=ctx.config.name)
+
+
+def _export(current: Span):
+    if TRACE_EXPORTER == "none":
+        return
+    line = json.dumps(current.to_dict(), ensure_ascii=False, default=str)
+    if TRACE_EXPORTER == "console":
+        logger.info(f"[TRACE] {line}")
+        return
+    try:
+        with _file_lock:
+            TRACE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            with TRACE_FILE.open("a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except OSError as e:
+        logger.warning(f"[TRACE] Erro a escrever {TRACE_FILE}: {e}")
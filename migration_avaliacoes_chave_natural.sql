@@ -0,0 +1,25 @@
+-- Importação idempotente do Excel (audio_service /upload/excel)
+
+-- Remover duplicados criados por uploads repetidos (mantém o registo mais recente)
+DELETE FROM avaliacoes_alunos a
+USING avaliacoes_alunos b
+WHERE a.ano_letivo = b.ano_letivo
+  AND a.periodo = b.periodo
+  AND a.turma = b.turma
+  AND a.disciplina = b.disciplina
+  AND a.id < b.id;
+
+-- Chave natural usada pelo INSERT ... ON CONFLICT DO UPDATE
+CREATE UNIQUE INDEX IF NOT EXISTS uq_avaliacoes_chave_natural
+    ON avaliacoes_alunos (ano_letivo, periodo, turma, disciplina);
+
+-- Hash do conteúdo de cada sheet importada (sheets inalteradas são ignoradas)
+CREATE TABLE IF NOT EXISTS avaliacoes_importacoes_sheets (
+    ano_letivo TEXT NOT NULL,
+    periodo TEXT NOT NULL,
+    sheet_name TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    registos INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (ano_letivo, periodo, sheet_name)
+);
@@ -0,0 +1,107 @@
+-- Rollups analíticos de avaliacoes_alunos (audio_service /api/avaliacoes/agregados)
+-- Medidas aditivas por (ano_letivo, periodo); a importação Excel recalcula
+-- apenas as fatias que escreveu
+
+-- Por ano letivo / período / ciclo / ano / disciplina
+CREATE TABLE IF NOT EXISTS avaliacoes_rollup_disciplina (
+    ano_letivo TEXT NOT NULL,
+    periodo TEXT NOT NULL,
+    ciclo TEXT NOT NULL,
+    ano TEXT NOT NULL,
+    disciplina TEXT NOT NULL,
+    registos INTEGER NOT NULL DEFAULT 0,
+    total_alunos INTEGER NOT NULL DEFAULT 0,
+    total_positivos INTEGER NOT NULL DEFAULT 0,
+    total_negativos INTEGER NOT NULL DEFAULT 0,
+    soma_percent_positivos DOUBLE PRECISION NOT NULL DEFAULT 0,
+    registos_com_percent INTEGER NOT NULL DEFAULT 0,
+    soma_media_ponderada NUMERIC,
+    alunos_com_media INTEGER,
+    classificacoes JSONB NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (ano_letivo, periodo, ciclo, ano, disciplina)
+);
+
+-- Preencher com os dados já importados
+DELETE FROM avaliacoes_rollup_disciplina;
+INSERT INTO avaliacoes_rollup_disciplina (
+    ano_letivo, periodo, ciclo, ano, disciplina,
+    registos, total_alunos, total_positivos, total_negativos,
+    soma_percent_positivos, registos_com_percent, soma_media_ponderada, alunos_com_media,
+    classificacoes
+)
+SELECT t.*, COALESCE(h.classificacoes, '{}'::jsonb)
+FROM (
+    SELECT ano_letivo, periodo, ciclo, ano, disciplina,
+    COUNT(*) AS registos,
+    COALESCE(SUM(total_alunos), 0) AS total_alunos,
+    COALESCE(SUM(total_positivos), 0) AS total_positivos,
+    COALESCE(SUM(total_negativos), 0) AS total_negativos,
+    COALESCE(SUM(percent_positivos), 0) AS soma_percent_positivos,
+    COUNT(percent_positivos) AS registos_com_percent,
+    SUM(media * total_alunos) FILTER (WHERE media IS NOT NULL) AS soma_media_ponderada,
+    SUM(total_alunos) FILTER (WHERE media IS NOT NULL) AS alunos_com_media
+    FROM avaliacoes_alunos
+    GROUP BY ano_letivo, periodo, ciclo, ano, disciplina
+) t
+LEFT JOIN (
+    SELECT ano_letivo, periodo, ciclo, ano, disciplina, jsonb_object_agg(key, n) AS classificacoes
+    FROM (
+        SELECT a.ano_letivo, a.periodo, a.ciclo, a.ano, a.disciplina, kv.key, SUM(kv.value::numeric) AS n
+        FROM avaliacoes_alunos a, jsonb_each_text(a.classificacoes) AS kv
+        GROUP BY a.ano_letivo, a.periodo, a.ciclo, a.ano, a.disciplina, kv.key
+    ) niveis
+    GROUP BY ano_letivo, periodo, ciclo, ano, disciplina
+) h USING (ano_letivo, periodo, ciclo, ano, disciplina);
+
+-- Por turma ao longo do tempo
+CREATE TABLE IF NOT EXISTS avaliacoes_rollup_turma (
+    ano_letivo TEXT NOT NULL,
+    periodo TEXT NOT NULL,
+    ciclo TEXT NOT NULL,
+    ano TEXT NOT NULL,
+    turma TEXT NOT NULL,
+    registos INTEGER NOT NULL DEFAULT 0,
+    total_alunos INTEGER NOT NULL DEFAULT 0,
+    total_positivos INTEGER NOT NULL DEFAULT 0,
+    total_negativos INTEGER NOT NULL DEFAULT 0,
+    soma_percent_positivos DOUBLE PRECISION NOT NULL DEFAULT 0,
+    registos_com_percent INTEGER NOT NULL DEFAULT 0,
+    soma_media_ponderada NUMERIC,
+    alunos_com_media INTEGER,
+    classificacoes JSONB NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (ano_letivo, periodo, ciclo, ano, turma)
+);
+
+-- Preencher com os dados já importados
+DELETE FROM avaliacoes_rollup_turma;
+INSERT INTO avaliacoes_rollup_turma (
+    ano_letivo, periodo, ciclo, ano, turma,
+    registos, total_alunos, total_positivos, total_negativos,
+    soma_percent_positivos, registos_com_percent, soma_media_ponderada, alunos_com_media,
+    classificacoes
+)
+SELECT t.*, COALESCE(h.classificacoes, '{}'::jsonb)
+FROM (
+    SELECT ano_letivo, periodo, ciclo, ano, turma,
+    COUNT(*) AS registos,
+    COALESCE(SUM(total_alunos), 0) AS total_alunos,
+    COALESCE(SUM(total_positivos), 0) AS total_positivos,
+    COALESCE(SUM(total_negativos), 0) AS total_negativos,
+    COALESCE(SUM(percent_positivos), 0) AS soma_percent_positivos,
+    COUNT(percent_positivos) AS registos_com_percent,
+    SUM(media * total_alunos) FILTER (WHERE media IS NOT NULL) AS soma_media_ponderada,
+    SUM(total_alunos) FILTER (WHERE media IS NOT NULL) AS alunos_com_media
+    FROM avaliacoes_alunos
+    GROUP BY ano_letivo, periodo, ciclo, ano, turma
+) t
+LEFT JOIN (
+    SELECT ano_letivo, periodo, ciclo, ano, turma, jsonb_object_agg(key, n) AS classificacoes
+    FROM (
+        SELECT a.ano_letivo, a.periodo, a.ciclo, a.ano, a.turma, kv.key, SUM(kv.value::numeric) AS n
+        FROM avaliacoes_alunos a, jsonb_each_text(a.classificacoes) AS kv
+        GROUP BY a.ano_letivo, a.periodo, a.ciclo, a.ano, a.turma, kv.key
+    ) niveis
+    GROUP BY ano_letivo, periodo, ciclo, ano, turma
+) h USING (ano_letivo, periodo, ciclo, ano, turma);
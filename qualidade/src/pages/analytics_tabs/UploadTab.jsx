@@ -6,6 +6,7 @@ const UploadTab = () => {
   const [uploadMessage, setUploadMessage] = useState(null);
   const [anoLetivo, setAnoLetivo] = useState('');
   const [periodo, setPeriodo] = useState('1');
+  const [jobProgress, setJobProgress] = useState(null);
 
   const handleFileUpload = async (e) => {
     const file = e.target.files?.[0];
@@ -32,21 +33,46 @@ const UploadTab = () => {
 
       const result = await response.json();
 
-      if (response.ok) {
+      if (!response.ok) {
+        setUploadMessage({ type: 'error', text: result.detail || 'Erro desconhecido' });
+        return;
+      }
+
+      // A importação corre em background: acompanhar o job até terminar
+      const job = await waitForJob(result.job_id);
+
+      if (job.status === 'done') {
+        const { registos_guardados, inalterados } = job.result;
         setUploadMessage({
           type: 'success',
-          text: `Sucesso! ${result.registos_guardados} registos guardados`,
+          text: `Sucesso! ${registos_guardados} registos guardados` +
+            (inalterados ? ` (${inalterados} inalterados)` : ''),
         });
         setAnoLetivo('');
         setPeriodo('1');
         e.target.value = '';
       } else {
-        setUploadMessage({ type: 'error', text: result.detail || 'Erro desconhecido' });
+        setUploadMessage({
+          type: 'error',
+          text: job.status === 'cancelled' ? 'Importação cancelada' : (job.errors || []).join('; ') || 'Erro desconhecido',
+        });
       }
     } catch (err) {
       setUploadMessage({ type: 'error', text: 'Erro de rede ao enviar o ficheiro' });
     } finally {
       setUploading(false);
+      setJobProgress(null);
+    }
+  };
+
+  const waitForJob = async (jobId) => {
+    while (true) {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      const response = await fetch(`/upload/jobs/${jobId}`);
+      const job = await response.json();
+      if (!response.ok) throw new Error(job.detail);
+      setJobProgress(job);
+      if (['done', 'failed', 'cancelled'].includes(job.status)) return job;
     }
   };
 
@@ -102,7 +128,11 @@ const UploadTab = () => {
         {uploading && (
           <div className="flex items-center gap-2 text-indigo-600">
             <Loader2 className="w-5 h-5 animate-spin" />
-            <span>A processar ficheiro...</span>
+            <span>
+              A processar ficheiro...
+              {jobProgress?.sheets_total > 0 &&
+                ` (${jobProgress.sheets_done}/${jobProgress.sheets_total} sheets)`}
+            </span>
           </div>
         )}
 